@@ -20,6 +20,22 @@ class MysqlSettingsMixin:
     MYSQL_USERNAME: str = Field(title='mysql username', default=CHANGE_THIS)
     MYSQL_PASSWORD: str = Field(title='mysql password', default=CHANGE_THIS)
     MYSQL_DB_NAME: str = Field(title='mysql db name', default=CHANGE_THIS)
+    # mysql connection pool (per worker process)
+    MYSQL_POOL_SIZE: int = Field(title='mysql pool size per worker', default=5)
+    MYSQL_MAX_OVERFLOW: int = Field(title='mysql pool max overflow per worker', default=10)
+    MYSQL_POOL_TIMEOUT: float = Field(title='mysql pool checkout timeout seconds', default=30)
+    MYSQL_POOL_RECYCLE: int = Field(title='mysql pool recycle seconds', default=3600)
+    MYSQL_POOL_USE_LIFO: bool = Field(title='mysql pool lifo mode', default=True)
+    MYSQL_POOL_PRE_PING: bool = Field(title='mysql pool pre ping', default=True)
+    MYSQL_POOL_AUTO_SIZE: bool = Field(title='size mysql pool from worker count and max connections', default=False)
+    MYSQL_MAX_CONNECTIONS: int = Field(title='mysql server max_connections budget', default=151)
+    MYSQL_RESERVED_CONNECTIONS: int = Field(title='mysql connections reserved for other clients', default=10)
+    MYSQL_POOL_SLOW_CHECKOUT: float = Field(title='log mysql pool checkouts slower than seconds', default=0.1)
+    # mysql read replicas
+    MYSQL_REPLICA_HOSTS: List[str] = Field(title='mysql replica hosts, ["host:port"]', default=[])
+    # round_robin / least_connections
+    MYSQL_REPLICA_STRATEGY: str = Field(title='mysql replica balance strategy', default='round_robin')
+    MYSQL_READ_YOUR_WRITES_WINDOW: float = Field(title='read from primary for seconds after a write', default=5)
 
     @computed_field
     @property
@@ -38,6 +54,24 @@ class MysqlSettingsMixin:
             path=self.MYSQL_DB_NAME,
         ).unicode_string()
 
+    @computed_field
+    @property
+    def SQLALCHEMY_REPLICA_URIS(self) -> List[str]:
+        uris = []
+        for replica in self.MYSQL_REPLICA_HOSTS:
+            host, _, port = replica.partition(':')
+            uris.append(
+                MultiHostUrl.build(
+                    scheme='mysql+aiomysql',
+                    username=self.MYSQL_USERNAME,
+                    password=self.MYSQL_PASSWORD,
+                    host=host,
+                    port=int(port or self.MYSQL_PORT),
+                    path=self.MYSQL_DB_NAME,
+                ).unicode_string()
+            )
+        return uris
+
 
 class RedisSettingsMixin:
     # redis connect info
@@ -45,6 +79,25 @@ class RedisSettingsMixin:
     REDIS_PORT: int = Field(title='redis port', default=6379)
     REDIS_PASSWORD: Optional[str] = Field(title='redis password', default=None)
     REDIS_PATH: str = Field(title='redis path', default='0')
+    # redis connection pool (per worker process)
+    REDIS_MAX_CONNECTIONS: int = Field(title='redis max connections per worker', default=20)
+    REDIS_POOL_TIMEOUT: float = Field(title='redis pool checkout timeout seconds', default=5)
+    REDIS_SOCKET_TIMEOUT: float = Field(title='redis socket timeout seconds', default=5)
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = Field(title='redis socket connect timeout seconds', default=3)
+    REDIS_HEALTH_CHECK_INTERVAL: int = Field(title='redis health check interval seconds', default=30)
+    REDIS_RETRY_ATTEMPTS: int = Field(title='redis retry attempts', default=3)
+    REDIS_RETRY_BACKOFF_BASE: float = Field(title='redis retry backoff base seconds', default=0.1)
+    REDIS_RETRY_BACKOFF_CAP: float = Field(title='redis retry backoff cap seconds', default=3)
+    # query cache
+    QUERY_CACHE_L1_SIZE: int = Field(title='query cache local lru size', default=1024)
+    QUERY_CACHE_L1_TTL: float = Field(title='query cache local lru ttl seconds', default=5)
+
+    RATE_LIMIT_ENABLED: bool = Field(title='enable redis rate limiting', default=False)
+    RATE_LIMIT_ALGORITHM: str = Field(title='sliding_window or token_bucket', default='sliding_window')
+    RATE_LIMIT_KEY_BY: List[str] = Field(title='rate limit key parts, ["ip", "user", "route"]', default=['ip'])
+    RATE_LIMIT_REQUESTS: int = Field(title='requests allowed per rate limit window', default=120)
+    RATE_LIMIT_WINDOW: float = Field(title='rate limit window seconds', default=60)
+    RATE_LIMIT_LOCAL_RATIO: float = Field(title='share of remaining quota served locally, 0 disables', default=0.5)
 
     @computed_field
     @property
@@ -74,11 +127,54 @@ class CommonSettings(BaseSettings):
     VERSION: str = Field(title='版本号', default='0.0.1')
     API_V1_PREFIX: str = Field(title='v1接口前缀', default='/api/v1')
     ENABLE_API_DOCS: bool = Field(title='是否启用接口文档', default=True)
+    WEB_WORKERS: int = Field(title='web 工作进程数', default=4)
+
+    SNOWFLAKE_DATA_CENTER_ID: Optional[int] = Field(title='雪花 ID 数据中心标识', default=None)
+    SNOWFLAKE_WORKER_ID: Optional[int] = Field(title='雪花 ID 固定机器标识，为空时自动分配', default=None)
+    SNOWFLAKE_LEASE_TTL: int = Field(title='雪花 ID 机器标识租约有效期（秒）', default=30)
+    # 各部分位数之和不超过 53 时 ID 在 JS 中可安全表示，31 位时间戳约 24.8 天循环一次，需要长期唯一时使用 63 位布局
+    SNOWFLAKE_TIMESTAMP_BITS: int = Field(title='雪花 ID 时间戳位数', default=31)
+    SNOWFLAKE_DATA_CENTER_BITS: int = Field(title='雪花 ID 数据中心标识位数', default=5)
+    SNOWFLAKE_WORKER_BITS: int = Field(title='雪花 ID 机器标识位数', default=5)
+    SNOWFLAKE_SEQUENCE_BITS: int = Field(title='雪花 ID 序列号位数', default=12)
+    SNOWFLAKE_THREAD_SLOT_BITS: int = Field(title='雪花 ID 机器标识中划分给线程的位数，0 为不划分', default=0)
+    SNOWFLAKE_MAX_CLOCK_SKEW: int = Field(title='雪花 ID 容忍的时钟回拨（毫秒）', default=2000)
+
+    IS_PRINT_SQL: bool = Field(title='是否打印所有 SQL 语句', default=False)
+    SQL_SLOW_THRESHOLD: float = Field(title='慢查询阈值（秒）', default=0.2)
+    SQL_N_PLUS_ONE_THRESHOLD: int = Field(title='同一请求内相同语句执行多少次时视为 N+1 查询', default=10)
+    SQL_EXPLAIN_SLOW: bool = Field(title='开发环境是否对慢查询执行 EXPLAIN', default=True)
+    METRICS_ENABLED: bool = Field(title='是否启用 /metrics 监控指标', default=True)
+    METRICS_MULTIPROC_DIR: str = Field(title='gunicorn 多进程模式下的指标文件目录', default='/tmp/prometheus_multiproc')
+    METRICS_COLLECT_INTERVAL: float = Field(title='事件循环延迟和连接池指标的采集间隔（秒）', default=1)
+    METRICS_TOKEN: Optional[str] = Field(title='访问 /metrics 的 Bearer 令牌，为空时只允许内网访问', default=None)
+    METRICS_ALLOWED_NETWORKS: List[str] = Field(
+        title='未配置令牌时允许访问 /metrics 的网段',
+        default=['127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16'],
+    )
+    PROFILING_SECRET: Optional[str] = Field(title='请求分析令牌的签名密钥，为空时不能通过令牌触发', default=None)
+    PROFILING_SAMPLE_RATE: float = Field(title='请求分析抽样率，0 为不抽样', default=0)
+    PROFILING_INTERVAL: float = Field(title='请求分析的采样间隔（秒）', default=0.001)
+    PROFILING_DIR: str = Field(title='请求分析报告目录', default=f'{PROJECT_ROOT}/logs/profiles')
+    LOG_FORMAT: str = Field(title='日志格式，text 或 json', default='text')
+    ACCESS_LOG_ENABLED: bool = Field(title='是否记录应用访问日志', default=True)
+    GUNICORN_ACCESS_LOG: bool = Field(title='是否保留 gunicorn 访问日志', default=False)
+    LOG_QUEUE_ENABLED: bool = Field(title='日志是否经队列由后台线程写出', default=True)
+    LOG_QUEUE_SIZE: int = Field(title='日志队列长度', default=10000)
+    LOG_QUEUE_DROP_OLDEST: bool = Field(title='日志队列满时丢弃最旧的记录，否则丢弃新记录', default=False)
+
+    PASSWORD_HASH_EXECUTOR: str = Field(title='密码哈希执行器，thread 或 process', default='thread')
+    PASSWORD_HASH_WORKERS: int = Field(title='密码哈希并发数', default=2)
+    PASSWORD_HASH_MAX_PENDING: int = Field(title='密码哈希最大排队数，超出时返回 503', default=64)
 
     JWT_ALGORITHM: str = Field(title='JWT 算法', default='HS256')
     JWT_SECRET_KEY: str = Field(title='JWT 密钥', default=CHANGE_THIS)
+    JWT_JWKS_PATH: Optional[str] = Field(title='JWT 密钥集合（JWKS）文件路径，为空时使用 JWT 密钥', default=None)
+    JWT_SIGNING_KID: Optional[str] = Field(title='JWT 签名密钥的 kid，为空时使用第一个私钥', default=None)
     JWT_ATK_EXP_DELTA: int = Field(title='access token 过期时间差', default=15 * 60)
     JWT_RTK_EXP_DELTA: int = Field(title='refresh token 过期时间差', default=7 * 24 * 60 * 60)
+    TOKEN_CACHE_SIZE: int = Field(title='已验证令牌的本地缓存数量', default=10000)
+    TOKEN_DENYLIST_CHECK_INTERVAL: float = Field(title='同一令牌检查吊销名单的间隔（秒）', default=5)
 
     @model_validator(mode='after')
     def _enforce_non_default_secrets(self) -> Self:
@@ -116,11 +212,6 @@ class CommonSettings(BaseSettings):
     def ZERO_WORD(self) -> str:
         return '\u200b'
 
-    @computed_field
-    @property
-    def IS_PRINT_SQL(self) -> bool:
-        return not self.IS_PROD
-
 
 class DevSettings(CommonSettings, MysqlSettingsMixin, RedisSettingsMixin): ...
 
@@ -1,9 +1,13 @@
+import glob
 import logging
+import os
 from logging.handlers import TimedRotatingFileHandler
 
+from config import settings
+
 # 基础日志配置
 loglevel = 'debug'
-workers = 4
+workers = settings.WEB_WORKERS
 bind = '0.0.0.0:8000'
 
 # 配置日志分割
@@ -29,6 +33,30 @@ error_log_handler = TimedRotatingFileHandler(
 error_log_handler.suffix = '%Y-%m-%d'
 error_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 
-# 绑定日志处理器
-logging.getLogger('gunicorn.access').addHandler(access_log_handler)
+# 绑定日志处理器，应用已按请求记录访问日志，默认不再输出 gunicorn 的访问日志
+# uvicorn 的访问日志沿用 gunicorn.access 的处理器，没有处理器时跳过格式化
+if settings.GUNICORN_ACCESS_LOG:
+    logging.getLogger('gunicorn.access').addHandler(access_log_handler)
 logging.getLogger('gunicorn.error').addHandler(error_log_handler)
+
+# 监控指标使用多进程模式，各 worker 将指标写入文件，/metrics 汇总所有 worker 的指标
+# 环境变量需要在 worker 导入 prometheus_client 之前设置
+if settings.METRICS_ENABLED:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', settings.METRICS_MULTIPROC_DIR)
+
+
+def on_starting(server):
+    # 清理上次运行遗留的指标文件，目录可能由运维指定，只删除其中的指标文件（*.db）
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # 移除已退出 worker 的 live 类型指标
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
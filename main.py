@@ -1,8 +1,8 @@
 import traceback
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError, HTTPException
-from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.staticfiles import StaticFiles
 from os.path import dirname, join
@@ -10,10 +10,31 @@ from os.path import dirname, join
 from config import settings
 from schemas.common import FailResponse, EResponseCode
 from routes import register_routes
-from utils.logger import logger
+from utils.access_log import AccessLogMiddleware, REQUEST_ID_HEADER
+from utils.logger import logger, stop_log_listener
+from utils.metrics import MetricsMiddleware, start_metrics_collector, stop_metrics_collector
+from utils.profiler import ProfilingMiddleware
 from utils.errors import get_response_mapper
+from utils.ratelimit import RateLimitMiddleware
+from utils.response import FastJSONResponse
+from utils.security import shutdown_password_hash_executor
+from utils.snowflake import acquire_worker_lease, release_worker_lease
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # 为当前 worker 进程分配唯一的雪花 ID 机器标识
+    await acquire_worker_lease()
+    start_metrics_collector()
+    yield
+    stop_metrics_collector()
+    await release_worker_lease()
+    shutdown_password_hash_executor()
+    stop_log_listener()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     root_path=settings.API_V1_PREFIX,
     responses=get_response_mapper(),
     title=settings.PROJECT_NAME,
@@ -22,6 +43,8 @@ app = FastAPI(
     **({} if settings.ENABLE_API_DOCS else dict(openapi_url=None, docs_url=None, redoc_url=None)),
 )
 
+# 配置限流中间件，先于 CORS 添加位于其内层，使 429 响应同样带有 CORS 头
+app.add_middleware(RateLimitMiddleware)
 # 配置 CORS 中间件
 app.add_middleware(
     CORSMiddleware,
@@ -29,7 +52,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=[REQUEST_ID_HEADER],
 )
+# 配置请求分析中间件，未配置令牌密钥和抽样率时不添加，对请求没有任何开销
+if settings.PROFILING_SECRET or settings.PROFILING_SAMPLE_RATE:
+    app.add_middleware(ProfilingMiddleware)
+# 配置监控指标中间件
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+# 配置访问日志中间件，位于最外层，请求 ID 和耗时覆盖限流与 CORS
+app.add_middleware(AccessLogMiddleware)
 register_routes(app)
 
 STATIC_DIR = join(dirname(__file__), 'static')
@@ -38,9 +70,10 @@ app.mount('/', StaticFiles(directory=STATIC_DIR, html=True))
 
 @app.exception_handler(HTTPException)
 def http_exception_handler(request: Request, error: HTTPException):
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=error.status_code,
-        content=FailResponse(msg=error.detail, code=error.status_code).model_dump(),
+        content=FailResponse(msg=error.detail, code=error.status_code),
+        headers=error.headers,
     )
 
 
@@ -48,9 +81,9 @@ def http_exception_handler(request: Request, error: HTTPException):
 def validation_exception_handler(request: Request, errors: list):
     if settings.IS_DEV:
         logger.warning(errors)
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=EResponseCode.PARAMS_ERR,
-        content=FailResponse(msg='参数错误', code=EResponseCode.PARAMS_ERR).model_dump(),
+        content=FailResponse(msg='参数错误', code=EResponseCode.PARAMS_ERR),
     )
 
 
@@ -59,7 +92,7 @@ def unexpected_exception_handler(request: Request, exc: Exception):
     if settings.IS_PROD:
         stack_trace = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
         logger.error(f'未经处理的异常: {stack_trace}')
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=EResponseCode.SERVER_ERR,
-        content=FailResponse(msg='服务异常，请稍后重试', code=EResponseCode.SERVER_ERR).model_dump(),
+        content=FailResponse(msg='服务异常，请稍后重试', code=EResponseCode.SERVER_ERR),
     )
@@ -1,7 +1,13 @@
 from fastapi import FastAPI
 
+from config import settings
 from .hello import router as hello_router
+from .jwks import router as jwks_router
+from .metrics import router as metrics_router
 
 
 def register_routes(app: FastAPI):
     app.include_router(hello_router, prefix='/hello', tags=['hello'])
+    app.include_router(jwks_router, prefix='/.well-known', tags=['auth'])
+    if settings.METRICS_ENABLED:
+        app.include_router(metrics_router, prefix='/metrics', tags=['metrics'])
@@ -6,5 +6,6 @@ router = APIRouter()
 
 
 @router.get('')
-async def hello():
-    return SuccessResponse.make('fastapi-template!', msg='this is message')
+async def hello() -> SuccessResponse[str]:
+    # 声明了返回类型，FastAPI 按响应模型由 pydantic-core 直接序列化为 JSON bytes
+    return SuccessResponse[str].make('fastapi-template!', msg='this is message')
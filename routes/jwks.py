@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from utils import security
+from utils.response import FastJSONRoute
+
+router = APIRouter(route_class=FastJSONRoute)
+
+
+@router.get('/jwks.json')
+async def jwks():
+    """验签公钥集合，供其他服务在没有签名密钥的情况下验证令牌"""
+    return security.jwt_keys.get_public_jwks()
@@ -0,0 +1,34 @@
+import hmac
+from ipaddress import ip_address, ip_network
+
+from fastapi import APIRouter, Depends, Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from utils.errors import Http401Unauthorized, Http403Forbidden
+from utils.metrics import CONTENT_TYPE_LATEST, generate_metrics
+
+
+def verify_metrics_access(request: Request):
+    """配置了 METRICS_TOKEN 时校验 Bearer 令牌，否则只允许 METRICS_ALLOWED_NETWORKS 中的地址访问"""
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+            raise Http401Unauthorized('令牌无效')
+        return
+    # 经反向代理转发时客户端地址为代理地址，需要在代理上禁止外部访问 /metrics 或配置令牌
+    try:
+        address = ip_address(request.client.host)
+    except (AttributeError, ValueError):
+        raise Http403Forbidden('禁止访问')
+    if not any(address in ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS):
+        raise Http403Forbidden('禁止访问')
+
+
+router = APIRouter(dependencies=[Depends(verify_metrics_access)])
+
+
+@router.get('', include_in_schema=False)
+async def metrics():
+    # 多进程模式下需要读取所有 worker 的指标文件，放到线程池中执行避免阻塞事件循环
+    return Response(await run_in_threadpool(generate_metrics), media_type=CONTENT_TYPE_LATEST)
@@ -28,6 +28,11 @@ class PageParams(BaseModel):
         return values
 
 
+class CursorParams(BaseModel):
+    cursor: Optional[str] = Field(None, description='分页游标，为空时查询第一页')
+    size: int = Field(20, description='每页条数')
+
+
 class EResponseCode:
     """响应码"""
 
@@ -37,18 +42,39 @@ class EResponseCode:
     FORBIDDEN = 403
     NOT_FOUND = 404
     PARAMS_ERR = 422
+    TOO_MANY_REQUESTS = 429
     SERVER_ERR = 500
     NOT_IMPL = 501
 
 
+class ECountStrategy(str, Enum):
+    """分页总数统计方式"""
+
+    EXACT = 'exact'  # 精确统计 count(*)
+    SKIP = 'skip'  # 不统计总数，多查一条判断是否有下一页
+    ESTIMATED = 'estimated'  # 使用执行计划估算（仅 MySQL，其他数据库退化为精确统计）
+    CACHED = 'cached'  # 精确统计并缓存到 redis
+
+
 class PaginateResult(BaseModel, Generic[T]):
     """分页响应模型"""
 
-    total: int = Field(title='总条数')
+    total: Optional[int] = Field(title='总条数，不统计总数时为空')
     items: List[T] = Field(title='数据列表')
     page: int
     size: int
-    pages: int
+    pages: Optional[int] = Field(title='总页数，不统计总数时为空')
+    has_next: bool = Field(False, title='是否有下一页')
+    total_strategy: ECountStrategy = Field(ECountStrategy.EXACT, title='总数统计方式')
+
+
+class CursorResult(BaseModel, Generic[T]):
+    """游标分页响应模型"""
+
+    items: List[T] = Field(title='数据列表')
+    size: int
+    next_cursor: Optional[str] = Field(None, title='下一页游标')
+    prev_cursor: Optional[str] = Field(None, title='上一页游标')
 
 
 class BaseResponse(BaseModel, Generic[T]):
@@ -0,0 +1,91 @@
+"""
+批量插入性能对比：逐个 db.add 的 ORM 写法 与 utils.query.bulk_insert
+
+python scripts/bench_bulk_insert.py [-n 行数] [-c chunk_size] [-u 数据库连接]
+默认使用 sqlite 内存数据库，可通过 -u 指定 mysql+aiomysql:// 连接进行测试
+"""
+
+import asyncio
+import os
+import sys
+import time
+from os.path import dirname, join
+from typing import List
+
+__dirname = dirname(__file__)
+sys.path.append(join(__dirname, '..'))
+os.environ.setdefault('RUNENV', 'test')
+
+from sqlalchemy import Column, BigInteger, String, Integer, delete  # noqa
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession  # noqa
+from sqlalchemy.orm import declarative_base  # noqa
+
+from utils.query import bulk_insert  # noqa
+from utils.snowflake import get_next_id  # noqa
+
+BenchBase = declarative_base()
+
+
+class BenchItem(BenchBase):
+    __tablename__ = 'bench_bulk_item'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    name = Column(String(64))
+    score = Column(Integer)
+
+
+def make_rows(n: int) -> List[dict]:
+    return [dict(name=f'item-{i}', score=i % 100) for i in range(n)]
+
+
+async def bench_orm(session_maker, rows: List[dict]) -> float:
+    start = time.perf_counter()
+    async with session_maker() as db:
+        async with db.begin():
+            for row in rows:
+                db.add(BenchItem(id=get_next_id(), **row))
+    return time.perf_counter() - start
+
+
+async def bench_bulk(session_maker, rows: List[dict], chunk_size: int) -> float:
+    start = time.perf_counter()
+    async with session_maker() as db:
+        async with db.begin():
+            await bulk_insert(db, BenchItem, rows, chunk_size=chunk_size)
+    return time.perf_counter() - start
+
+
+async def run(n: int, chunk_size: int, url: str):
+    engine = create_async_engine(url)
+    session_maker = async_sessionmaker(engine, class_=AsyncSession)
+    async with engine.begin() as conn:
+        await conn.run_sync(BenchBase.metadata.drop_all)
+        await conn.run_sync(BenchBase.metadata.create_all)
+    rows = make_rows(n)
+    benches = (
+        ('orm db.add', lambda: bench_orm(session_maker, rows)),
+        ('bulk_insert', lambda: bench_bulk(session_maker, rows, chunk_size)),
+    )
+    for name, bench in benches:
+        elapsed = await bench()
+        print(f'{name:<12} {n} rows  {elapsed:.3f}s  {n / elapsed:,.0f} rows/s')
+        async with engine.begin() as conn:
+            await conn.execute(delete(BenchItem.__table__))
+    async with engine.begin() as conn:
+        await conn.run_sync(BenchBase.metadata.drop_all)
+    await engine.dispose()
+
+
+def main(args: List[str] = None):
+    args = args or sys.argv[1:]
+    if '-h' in args:
+        print(__doc__)
+        return
+    n = int(args[args.index('-n') + 1]) if '-n' in args else 20000
+    chunk_size = int(args[args.index('-c') + 1]) if '-c' in args else 500
+    url = args[args.index('-u') + 1] if '-u' in args else 'sqlite+aiosqlite:///:memory:'
+    asyncio.run(run(n, chunk_size, url))
+
+
+if __name__ == '__main__':
+    main()
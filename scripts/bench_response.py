@@ -0,0 +1,100 @@
+"""
+响应序列化性能对比：FastAPI 默认处理、FastJSONResponse、FastJSONRoute，以及声明响应类型
+声明响应类型的接口在应用设置了默认响应类时 FastAPI 不再由 pydantic-core 直接序列化，对比见最后两项
+分别测试小响应和 1000 条数据的 PaginateResult
+
+python scripts/bench_response.py [-n 请求数] [-s 分页条数]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from os.path import dirname, join
+from typing import List
+
+__dirname = dirname(__file__)
+sys.path.append(join(__dirname, '..'))
+os.environ.setdefault('RUNENV', 'test')
+
+import httpx  # noqa
+from fastapi import APIRouter, FastAPI  # noqa
+from fastapi.routing import APIRoute  # noqa
+from pydantic import BaseModel  # noqa
+
+from schemas.common import PaginateResult, SuccessResponse  # noqa
+from utils.response import FastJSONResponse, FastJSONRoute  # noqa
+
+
+class BenchItem(BaseModel):
+    id: int
+    name: str
+    score: float
+    tags: List[str]
+
+
+def make_page(size: int) -> PaginateResult[BenchItem]:
+    items = [BenchItem(id=i, name=f'item-{i}', score=i / 3, tags=['a', 'b']) for i in range(size)]
+    return PaginateResult[BenchItem](total=size, items=items, page=1, size=size, pages=1)
+
+
+def make_app(page: PaginateResult[BenchItem], response_class=None, route_class=APIRoute) -> FastAPI:
+    app = FastAPI(**(dict(default_response_class=response_class) if response_class else {}))
+    router = APIRouter(route_class=route_class)
+
+    @router.get('/untyped/small')
+    async def untyped_small():
+        return SuccessResponse.make('fastapi-template!')
+
+    @router.get('/untyped/page')
+    async def untyped_page():
+        return SuccessResponse.make(page)
+
+    @router.get('/typed/small')
+    async def typed_small() -> SuccessResponse[str]:
+        return SuccessResponse[str].make('fastapi-template!')
+
+    @router.get('/typed/page')
+    async def typed_page() -> SuccessResponse[PaginateResult[BenchItem]]:
+        return SuccessResponse[PaginateResult[BenchItem]].make(page)
+
+    app.include_router(router)
+    return app
+
+
+async def measure(app: FastAPI, path: str, n: int) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+        await client.get(path)
+        start = time.perf_counter()
+        for _ in range(n):
+            await client.get(path)
+        return n / (time.perf_counter() - start)
+
+
+async def run(n: int, size: int):
+    page = make_page(size)
+    benches = (
+        ('untyped JSONResponse', make_app(page), 'untyped'),
+        ('untyped FastJSONResponse', make_app(page, FastJSONResponse), 'untyped'),
+        ('untyped FastJSONRoute', make_app(page, route_class=FastJSONRoute), 'untyped'),
+        ('typed', make_app(page), 'typed'),
+        ('typed FastJSONResponse', make_app(page, FastJSONResponse), 'typed'),
+    )
+    for name, app, prefix in benches:
+        small = await measure(app, f'/{prefix}/small', n)
+        large = await measure(app, f'/{prefix}/page', max(n // 10, 1))
+        print(f'{name:<26} small {small:>8,.0f} req/s  page({size}) {large:>8,.0f} req/s')
+
+
+def main(args: List[str] = None):
+    args = args or sys.argv[1:]
+    if '-h' in args:
+        print(__doc__)
+        return
+    n = int(args[args.index('-n') + 1]) if '-n' in args else 2000
+    size = int(args[args.index('-s') + 1]) if '-s' in args else 1000
+    asyncio.run(run(n, size))
+
+
+if __name__ == '__main__':
+    main()
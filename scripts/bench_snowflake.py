@@ -0,0 +1,52 @@
+"""
+雪花 ID 生成性能对比：逐个 get_next_id 与批量 get_next_ids
+
+python scripts/bench_snowflake.py [-n 数量] [-b 批量大小] [-t 线程数]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import dirname, join
+from typing import List
+
+__dirname = dirname(__file__)
+sys.path.append(join(__dirname, '..'))
+
+from utils.snowflake import get_next_id, get_next_ids  # noqa
+
+
+def single(n: int, _batch: int):
+    for _ in range(n):
+        get_next_id()
+
+
+def batched(n: int, batch: int):
+    for start in range(0, n, batch):
+        get_next_ids(min(batch, n - start))
+
+
+def run(name: str, func, n: int, batch: int, threads: int):
+    per_thread = n // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: func(per_thread, batch), range(threads)))
+    elapsed = time.perf_counter() - start
+    total = per_thread * threads
+    print(f'{name:<8} threads={threads:<3} {total} ids  {elapsed:.3f}s  {total / elapsed:,.0f} ids/s')
+
+
+def main(args: List[str] = None):
+    args = args or sys.argv[1:]
+    if '-h' in args:
+        print(__doc__)
+        return
+    n = int(args[args.index('-n') + 1]) if '-n' in args else 1_000_000
+    batch = int(args[args.index('-b') + 1]) if '-b' in args else 1000
+    threads = int(args[args.index('-t') + 1]) if '-t' in args else 1
+    run('single', single, n, batch, threads)
+    run('batched', batched, n, batch, threads)
+
+
+if __name__ == '__main__':
+    main()
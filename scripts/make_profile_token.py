@@ -0,0 +1,33 @@
+"""
+生成请求分析令牌，需要与服务使用相同的 PROFILING_SECRET
+
+python scripts/make_profile_token.py [-t 有效期秒数]
+curl -H "X-Profile-Token: <token>" http://localhost:8000/hello
+报告保存在服务的 PROFILING_DIR 中，文件名见响应头 X-Profile-Id
+"""
+
+import sys
+from os.path import dirname, join
+from typing import List
+
+__dirname = dirname(__file__)
+sys.path.append(join(__dirname, '..'))
+
+from config import settings  # noqa
+from utils.profiler import make_profile_token  # noqa
+
+
+def main(args: List[str] = None):
+    args = args or sys.argv[1:]
+    if '-h' in args:
+        print(__doc__)
+        return
+    if not settings.PROFILING_SECRET:
+        print('PROFILING_SECRET 未设置')
+        return
+    ttl = int(args[args.index('-t') + 1]) if '-t' in args else 300
+    print(make_profile_token(ttl))
+
+
+if __name__ == '__main__':
+    main()
@@ -55,6 +55,40 @@ def client() -> Generator[TestClient, None, None]:
         yield c
 
 
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """get_async_db 使用临时目录中的 sqlite 数据库，引擎与正式引擎一样带有语句计时和检查，适用于同步测试"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from utils.connect import sql
+
+    engine = sql._create_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+    monkeypatch.setattr(sql, 'AsyncSessionLocal', async_sessionmaker(**dict(sql.AsyncSessionLocal.kw, bind=engine)))
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def fake_redis_server():
+    """内存中的 redis 服务（fakeredis，支持 Lua 脚本），connected 设为 False 时模拟 redis 不可用"""
+    from fakeredis import FakeServer
+
+    return FakeServer()
+
+
+@pytest.fixture
+def fake_redis(fake_redis_server, monkeypatch) -> Redis:
+    """get_async_redis_connection 和 get_async_redis_batcher 返回连接 fakeredis 的客户端，不需要真实的 redis"""
+    from fakeredis import FakeAsyncRedis
+    from utils.connect import nosql
+
+    client = FakeAsyncRedis(server=fake_redis_server, decode_responses=True)
+    monkeypatch.setattr(nosql, '_create_redis_client', lambda: client)
+    monkeypatch.setattr(nosql, '__redis_client', None)
+    monkeypatch.setattr(nosql, '__redis_batcher', None)
+    monkeypatch.setattr(nosql, '__redis_retry_at', 0.0)
+    return client
+
+
 @pytest.fixture(scope='session')
 def fake() -> Faker:
     _fake = Factory.create('zh_CN')
@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+from sqlalchemy import Column, Integer, String, insert, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+
+from utils import cache as cache_module
+from utils import query as q
+from utils.cache import QueryCache
+
+Base = declarative_base()
+
+
+class Note(Base):
+    __tablename__ = 'note'
+    id = Column(Integer, primary_key=True)
+    title = Column(String(32))
+
+
+@pytest.fixture
+async def cdb(fake_redis):
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        session.add(Note(id=1, title='a'))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+async def test_query_cache_hit(cdb, fake_redis):
+    cache = QueryCache(l1_ttl=0.05)
+    query = select(Note.id, Note.title)
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+    assert cache.stats == dict(l1_hits=1, hits=0, misses=1, bypassed=0, errors=0)
+
+    # 本地缓存过期后从 redis 读取
+    await asyncio.sleep(0.06)
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+    assert cache.stats == dict(l1_hits=1, hits=1, misses=1, bypassed=0, errors=0)
+
+
+async def test_query_cache_single_flight(fake_redis):
+    cache = QueryCache()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [1, 2]
+
+    results = await asyncio.gather(*(cache._get_or_load('key', ('note',), 60, loader) for _ in range(5)))
+    assert results == [b'[1,2]'] * 5 and calls == 1
+    assert cache.get_stats()['inflight'] == 0
+
+
+async def test_query_cache_stale_load(fake_redis):
+    """失效前开始的加载在失效后完成，结果不写入缓存"""
+    cache = QueryCache()
+    started, release = asyncio.Event(), asyncio.Event()
+    values = iter(['old', 'new', 'newer'])
+
+    async def loader():
+        started.set()
+        await release.wait()
+        return next(values)
+
+    pending = asyncio.ensure_future(cache._get_or_load('key', ('note',), 60, loader))
+    await started.wait()
+    await cache.invalidate('note')
+    release.set()
+    assert await pending == b'"old"'
+    assert await cache._get_or_load('key', ('note',), 60, loader) == b'"new"'
+    assert cache.stats['misses'] == 2
+
+    # 其他进程写入的旧代数缓存同样视为未命中
+    other = QueryCache()
+    await fake_redis.set('key', '0\n"old"')
+    assert await other._get_or_load('key', ('note',), 60, loader) == b'"newer"'
+
+
+async def test_query_cache_commit_invalidation(cdb, fake_redis, monkeypatch):
+    cache = QueryCache()
+    monkeypatch.setattr(cache_module, 'query_cache', cache)
+    query = select(Note.id, Note.title).order_by(Note.id)
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+
+    # 回滚不失效缓存
+    cdb.add(Note(id=2, title='b'))
+    await cdb.flush()
+    await cdb.rollback()
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+    assert cache.stats['l1_hits'] == 1
+
+    generation = int(await fake_redis.get(cache._generation_key('note')) or 0)
+    cdb.add(Note(id=2, title='b'))
+    await cdb.commit()
+    await asyncio.gather(*cache_module._pending_invalidations)
+    assert int(await fake_redis.get(cache._generation_key('note'))) == generation + 1
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a'), dict(id=2, title='b')]
+
+
+@pytest.mark.parametrize('mode', ['core', 'orm_update', 'text', 'bulk_insert'])
+async def test_query_cache_dml_invalidation(cdb, fake_redis, monkeypatch, mode):
+    """不经过 flush 的写入语句提交后同样失效缓存"""
+    cache = QueryCache()
+    monkeypatch.setattr(cache_module, 'query_cache', cache)
+    query = select(Note.title).order_by(Note.id)
+    assert await cache.get_parsed_many(cdb, query) == [dict(title='a')]
+
+    if mode == 'core':
+        await cdb.execute(insert(Note.__table__).values(id=2, title='b'))
+    elif mode == 'orm_update':
+        await cdb.execute(update(Note).where(Note.id == 1).values(title='b'))
+    elif mode == 'text':
+        await cdb.execute(text('DELETE FROM note WHERE id = 1'))
+    else:
+        await q.bulk_insert(cdb, Note, [dict(id=2, title='b')])
+    await cdb.commit()
+    await asyncio.gather(*cache_module._pending_invalidations)
+    expected = dict(core=['a', 'b'], orm_update=['b'], text=[], bulk_insert=['a', 'b'])[mode]
+    assert await cache.get_parsed_many(cdb, query) == [dict(title=title) for title in expected]
+    assert cache.stats['misses'] == 2
+
+
+async def test_query_cache_uncommitted_writes(cdb, fake_redis):
+    """会话中有未提交的写入时不读写缓存，回滚后不会读到回滚的数据"""
+    cache = QueryCache()
+    query = select(Note.id, Note.title).order_by(Note.id)
+    cdb.add(Note(id=2, title='b'))
+    await cdb.flush()
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a'), dict(id=2, title='b')]
+    await cdb.rollback()
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+
+    # 执行过 DML 的会话同样不使用缓存
+    await cdb.execute(update(Note).where(Note.id == 1).values(title='x'))
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='x')]
+    await cdb.rollback()
+    assert await cache.get_parsed_many(cdb, query) == [dict(id=1, title='a')]
+    assert cache.stats['bypassed'] == 2 and cache.stats['l1_hits'] == 1
+
+
+async def test_query_cache_owner_cancelled(fake_redis):
+    """发起加载的请求被取消时加载一起取消，等待的请求使用自身的加载函数重新加载"""
+    cache = QueryCache()
+    started = asyncio.Event()
+
+    async def hanging_loader():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def loader():
+        return [1]
+
+    owner = asyncio.ensure_future(cache._get_or_load('key', ('note',), 60, hanging_loader))
+    await started.wait()
+    waiter = asyncio.ensure_future(cache._get_or_load('key', ('note',), 60, loader))
+    await asyncio.sleep(0)
+    owner.cancel()
+    assert await waiter == b'[1]'
+    assert owner.cancelled() and cache.get_stats()['inflight'] == 0
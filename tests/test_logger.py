@@ -0,0 +1,62 @@
+import logging
+import queue
+
+import orjson
+
+
+def test_dropping_queue_handler():
+    from utils.logger import DroppingQueueHandler
+
+    def make_record(i):
+        return logging.LogRecord('test', logging.INFO, __file__, 1, 'record %d', (i,), None)
+
+    for drop_oldest, expected in ((False, ['record 0', 'record 1']), (True, ['record 3', 'record 4'])):
+        handler = DroppingQueueHandler(queue.Queue(2), drop_oldest=drop_oldest)
+        for i in range(5):
+            handler.handle(make_record(i))
+        assert handler.dropped == 3
+        assert [handler.queue.get_nowait().msg for _ in range(2)] == expected
+
+
+def test_access_log_middleware(temp_db):
+    from fastapi import APIRouter, FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+
+    from utils.access_log import AccessLogMiddleware
+    from utils.connect import get_async_db
+    from utils.logger import JsonFormatter, access_logger, logger, request_id_filter
+
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    handler = ListHandler()
+    handler.addFilter(request_id_filter)
+    router = APIRouter()
+
+    @router.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        async with get_async_db() as db:
+            await db.execute(text('SELECT 1'))
+        logger.info('get item %d', item_id)
+        return item_id
+
+    app = FastAPI()
+    app.add_middleware(AccessLogMiddleware)
+    app.include_router(router, prefix='/test')
+    logger.addHandler(handler)
+    try:
+        response = TestClient(app).get('/test/items/1', headers={'X-Request-ID': 'req-1'})
+    finally:
+        logger.removeHandler(handler)
+    assert response.headers['X-Request-ID'] == 'req-1'
+    item_record, access_record = records
+    assert item_record.request_id == access_record.request_id == 'req-1'
+    assert access_record.name == access_logger.name
+    assert access_record.route == '/test/items/{item_id}' and access_record.status == 200
+    assert access_record.db_count == 1
+    data = orjson.loads(JsonFormatter().format(access_record))
+    assert data['request_id'] == 'req-1' and data['route'] == '/test/items/{item_id}'
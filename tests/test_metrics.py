@@ -0,0 +1,73 @@
+def test_metrics_middleware(temp_db):
+    from fastapi import APIRouter, FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+
+    from routes.metrics import router as metrics_router
+    from utils.connect import get_async_db
+    from utils.metrics import MetricsMiddleware
+
+    router = APIRouter()
+
+    @router.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        async with get_async_db() as db:
+            await db.execute(text('SELECT 1'))
+        return item_id
+
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router, prefix='/test')
+    app.include_router(metrics_router, prefix='/metrics')
+    client = TestClient(app, client=('10.0.0.8', 50000))
+    client.get('/test/items/1')
+    client.get('/not-found/1')
+    body = client.get('/metrics').text
+    assert 'http_requests_total{method="GET",route="/test/items/{item_id}",status="200"} 1.0' in body
+    assert 'http_requests_total{method="GET",route="<unmatched>",status="404"} 1.0' in body
+    assert 'db_query_duration_seconds_count{operation="SELECT"}' in body
+
+
+def test_metrics_access(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from config import settings
+    from routes.metrics import router as metrics_router
+
+    app = FastAPI()
+    app.include_router(metrics_router, prefix='/metrics')
+
+    # 未配置令牌时只允许内网访问
+    assert TestClient(app, client=('127.0.0.1', 50000)).get('/metrics').status_code == 200
+    assert TestClient(app, client=('203.0.113.5', 50000)).get('/metrics').status_code == 403
+
+    monkeypatch.setattr(settings, 'METRICS_TOKEN', 'secret')
+    client = TestClient(app, client=('127.0.0.1', 50000))
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_disabled(temp_db, monkeypatch):
+    import asyncio
+
+    from sqlalchemy import text
+
+    from config import settings
+    from utils.connect import get_async_db, sql
+
+    observed = []
+    monkeypatch.setattr(sql, 'observe_db_query', lambda statement, elapsed: observed.append(statement))
+
+    async def run():
+        async with get_async_db() as db:
+            await db.execute(text('SELECT 1'))
+
+    # 关闭监控指标时语句执行不记录指标
+    monkeypatch.setattr(settings, 'METRICS_ENABLED', False)
+    asyncio.run(run())
+    assert observed == []
+    monkeypatch.setattr(settings, 'METRICS_ENABLED', True)
+    asyncio.run(run())
+    assert 'SELECT 1' in observed
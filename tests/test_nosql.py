@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError, ResponseError
+
+from config import settings
+from utils.connect import nosql
+from utils.connect.nosql import BatchingRedis
+
+
+class RecordingBatchingRedis(BatchingRedis):
+    """连接 fakeredis，记录每个 pipeline 发送的命令"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = []
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def record_and_execute(raise_on_error: bool = True):
+            self.sent.append([args[0] for args, _ in pipe.command_stack])
+            return await execute(raise_on_error=raise_on_error)
+
+        pipe.execute = record_and_execute
+        return pipe
+
+
+@pytest.fixture
+def batcher(fake_redis):
+    return RecordingBatchingRedis(connection_pool=fake_redis.connection_pool)
+
+
+async def test_batching_redis_gather(batcher):
+    await batcher.mset(dict(a='1', b='text'))
+    batcher.sent.clear()
+    results = await asyncio.gather(batcher.get('a'), batcher.incr('a'), batcher.get('b'), batcher.set('c', 'x'))
+    assert results == ['1', 2, 'text', True]
+    # 同一周期内的命令合并为一个 pipeline
+    assert batcher.sent == [['GET', 'INCRBY', 'GET', 'SET']]
+
+    # 依次 await 的命令各自发送
+    assert await batcher.get('a') == '2'
+    assert await batcher.get('c') == 'x'
+    assert batcher.sent[1:] == [['GET'], ['GET']]
+
+
+async def test_batching_redis_batch(batcher):
+    with batcher.batch():
+        futures = [batcher.set('a', '1'), batcher.incr('a'), batcher.get('a')]
+        # 上下文内只收集命令，退出时才发送
+        assert batcher.sent == []
+    assert await asyncio.gather(*futures) == [True, 2, '2']
+    assert batcher.sent == [['SET', 'INCRBY', 'GET']]
+
+
+async def test_batching_redis_errors(batcher, fake_redis_server):
+    await batcher.mset(dict(a='1', b='text'))
+    batcher.sent.clear()
+    get_a, incr_b, incr_a = batcher.get('a'), batcher.incr('b'), batcher.incr('a')
+    # 单个命令出错只影响自身的调用方
+    assert await get_a == '1'
+    with pytest.raises(ResponseError):
+        await incr_b
+    assert await incr_a == 2
+    assert len(batcher.sent) == 1
+
+    # pipeline 发送失败时所有调用方都收到异常
+    fake_redis_server.connected = False
+    results = await asyncio.gather(batcher.get('a'), batcher.get('b'), return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+class FakeClient:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self.closed = False
+
+    async def ping(self):
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise ConnectionError('Connection refused')
+        return True
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    """替换客户端的创建，记录创建的客户端，state['fail'] 控制 ping 是否失败"""
+    clients, state = [], dict(fail=False)
+
+    def create_client():
+        clients.append(FakeClient(state['fail']))
+        return clients[-1]
+
+    monkeypatch.setattr(nosql, '_create_redis_client', create_client)
+    monkeypatch.setattr(nosql, '__redis_client', None)
+    monkeypatch.setattr(nosql, '__redis_retry_at', 0.0)
+    return clients, state
+
+
+async def test_redis_connection_cooldown(fake_clients):
+    clients, state = fake_clients
+    state['fail'] = True
+    with pytest.raises(ConnectionError, match='refused'):
+        await nosql.get_async_redis_connection()
+    assert len(clients) == 1 and clients[0].closed
+
+    # 冷却期内直接失败，不再创建客户端
+    with pytest.raises(ConnectionError, match='retry later'):
+        await nosql.get_async_redis_connection()
+    assert len(clients) == 1
+
+    # 冷却结束后重新连接，并发的首次请求只创建一个客户端
+    setattr(nosql, '__redis_retry_at', 0.0)
+    state['fail'] = False
+    results = await asyncio.gather(*(nosql.get_async_redis_connection() for _ in range(3)))
+    assert len(clients) == 2 and all(client is clients[1] for client in results)
+
+
+def test_redis_lock_across_loops(fake_clients):
+    """不同事件循环中并发获取连接，锁不会绑定到之前的事件循环"""
+    clients, _ = fake_clients
+
+    async def connect():
+        return await asyncio.gather(nosql.get_async_redis_connection(), nosql.get_async_redis_connection())
+
+    for _ in range(2):
+        setattr(nosql, '__redis_client', None)
+        first, second = asyncio.run(connect())
+        assert first is second is clients[-1]
+    assert len(clients) == 2
+
+
+async def test_redis_pool(monkeypatch):
+    monkeypatch.setattr(settings, 'REDIS_RETRY_BACKOFF_BASE', 0.1)
+    monkeypatch.setattr(settings, 'REDIS_RETRY_BACKOFF_CAP', 1)
+    client = nosql._create_redis_client()
+    pool = client.connection_pool
+    assert isinstance(pool, nosql.redis.BlockingConnectionPool)
+    assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+    assert pool.connection_class is nosql.TimedConnection
+    # 连接失败按指数退避重试，间隔不超过上限
+    retry = pool.connection_kwargs['retry']
+    assert retry._retries == settings.REDIS_RETRY_ATTEMPTS
+    assert [retry._backoff.compute(n) for n in range(6)] == [0.1, 0.2, 0.4, 0.8, 1, 1]
+    await client.aclose()
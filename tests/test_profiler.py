@@ -0,0 +1,26 @@
+import pytest
+
+
+def test_profile_token(monkeypatch):
+    from config import settings
+    from utils.profiler import make_profile_token, verify_profile_token
+
+    monkeypatch.setattr(settings, 'PROFILING_SECRET', 'secret')
+    token = make_profile_token()
+    assert verify_profile_token(token)
+    assert not verify_profile_token(make_profile_token(-1))
+    assert not verify_profile_token(token[:-1] + ('0' if token[-1] != '0' else '1'))
+    monkeypatch.setattr(settings, 'PROFILING_SECRET', None)
+    assert not verify_profile_token(token)
+
+
+def test_time_breakdown():
+    from utils.profiler import get_time_breakdown
+
+    self_times = [
+        ('/site-packages/pydantic/main.py', 'model_validate', 0.002),
+        ('/site-packages/fastapi/routing.py', 'serialize_response', 0.003),
+        ('/app/routes/hello.py', 'hello', 0.001),
+    ]
+    breakdown = get_time_breakdown(0.02, self_times, db_time=0.008, redis_time=0.002)
+    assert breakdown == pytest.approx(dict(handler=5.0, validation=2.0, serialization=3.0, sql=8.0, redis=2.0))
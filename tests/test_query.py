@@ -0,0 +1,247 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, MetaData, Table, select, literal
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from schemas.common import CursorParams, PageParams, ECountStrategy
+from config import settings
+from utils.query import (
+    paginate_query_by_cursor,
+    paginate_query,
+    get_parsed_many,
+    get_row_parser,
+    stream_parsed_many,
+    bulk_insert,
+    bulk_upsert,
+    _upsert_statement,
+)
+
+_metadata = MetaData()
+item_table = Table(
+    'item',
+    _metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(32)),
+    Column('score', Integer),
+)
+
+
+@pytest.fixture
+async def sdb():
+    """内存数据库，每个测试独立"""
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(_metadata.create_all)
+        await conn.execute(
+            item_table.insert(),
+            [dict(id=i, name=f'item-{i}', score=i % 3) for i in range(1, 26)],
+        )
+    async with async_sessionmaker(engine, class_=AsyncSession)() as session:
+        yield session
+    await engine.dispose()
+
+
+class ItemSchema(BaseModel):
+    id: int
+    tags: list
+
+
+async def test_get_parsed_many(sdb):
+    tags = settings.ZERO_WORD.join(['a', 'b'])
+    query = select(item_table.c.id, literal(tags).label('tags.list')).where(item_table.c.id <= 3)
+    items = await get_parsed_many(sdb, query, schema=ItemSchema)
+    assert items == [ItemSchema(id=i, tags=['a', 'b']) for i in range(1, 4)]
+    constructed = await get_parsed_many(sdb, query, schema=ItemSchema, skip_validation=True)
+    assert constructed == items
+    # 相同结构的查询共用同一个解析器
+    assert get_row_parser((1, tags), query=query) is get_row_parser((2, ''), query=query.limit(1))
+
+
+async def test_stream_parsed_many(sdb):
+    query = select(item_table.c.id, item_table.c.name).order_by(item_table.c.id)
+    batches = [batch async for batch in stream_parsed_many(sdb, query, yield_per=10)]
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert sum(batches, []) == await get_parsed_many(sdb, query)
+
+
+async def test_paginate_query_count_strategy(sdb):
+    query = select(item_table).order_by(item_table.c.id)
+    exact = await paginate_query(sdb, query, PageParams(page=2, size=10))
+    assert (exact.total, exact.pages, exact.has_next) == (25, 3, True)
+
+    skipped = await paginate_query(sdb, query, PageParams(page=3, size=10), count_strategy=ECountStrategy.SKIP)
+    assert skipped.total is None and skipped.has_next is False
+    assert [i['id'] for i in skipped.items] == list(range(21, 26))
+
+    # 非 MySQL 数据库估算退化为精确统计
+    estimated = await paginate_query(sdb, query, PageParams(size=10), count_strategy=ECountStrategy.ESTIMATED)
+    assert estimated.total_strategy == ECountStrategy.EXACT and estimated.total == 25
+
+    concurrent = await paginate_query(sdb, query, PageParams(page=2, size=10), concurrent=True)
+    assert concurrent == exact
+
+
+async def test_paginate_query_concurrent_error(sdb, monkeypatch):
+    import utils.query as query_module
+
+    sessions, cancelled = [], asyncio.Event()
+
+    async def fail_count(db, query, *args):
+        sessions.append(db)
+        raise ValueError('count failed')
+
+    async def slow_page(db, query, **kwargs):
+        sessions.append(db)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(query_module, 'count_query', fail_count)
+    monkeypatch.setattr(query_module, 'get_parsed_many', slow_page)
+    monkeypatch.setitem(sdb.info, 'use_replica', True)
+    with pytest.raises(ValueError, match='count failed'):
+        await paginate_query(sdb, select(item_table), PageParams(), concurrent=True)
+    # 总数查询出错时分页查询在会话关闭前被取消，两个会话沿用原会话的路由信息
+    assert cancelled.is_set()
+    assert all(db.info['use_replica'] and db.bind is sdb.bind for db in sessions)
+
+
+async def test_estimate_count(sdb, monkeypatch):
+    import utils.query as query_module
+    from sqlalchemy.exc import OperationalError
+
+    # 连接查询按外层各表估算值的乘积，子查询的行不计入
+    plans = [
+        dict(id=1, rows=100, filtered=50.0),
+        dict(id=1, rows=3, filtered=100.0),
+        dict(id=2, rows=1000, filtered=10.0),
+    ]
+    assert query_module._get_plan_estimate(plans) == 150
+    assert query_module._get_plan_estimate([]) == 0
+
+    # EXPLAIN 失败时退回精确统计
+    async def fail_estimate(db, query):
+        raise OperationalError('EXPLAIN', (), Exception('syntax error'))
+
+    # in_() 的参数展开后才能执行 EXPLAIN（SQLite 的 EXPLAIN 结果没有 rows 列，估算为 0）
+    query = select(item_table).where(item_table.c.id.in_([1, 2, 3]))
+    assert await query_module._estimate_count(sdb, query) == 0
+
+    monkeypatch.setattr(sdb.get_bind().dialect, 'name', 'mysql')
+    monkeypatch.setattr(query_module, '_estimate_count', fail_estimate)
+    total, strategy = await query_module.count_query(sdb, query, ECountStrategy.ESTIMATED)
+    assert (total, strategy) == (3, ECountStrategy.EXACT)
+    empty = await paginate_query(sdb, query.where(item_table.c.id < 0), PageParams(), concurrent=True)
+    assert (empty.total, empty.pages, empty.items) == (0, 0, [])
+
+
+async def test_paginate_query_by_cursor(sdb):
+    query = select(item_table.c.id, item_table.c.name).order_by(item_table.c.id.desc())
+    first = await paginate_query_by_cursor(sdb, query, CursorParams(size=10))
+    assert [i['id'] for i in first.items] == list(range(25, 15, -1))
+    assert first.prev_cursor is None
+
+    second = await paginate_query_by_cursor(sdb, query, CursorParams(cursor=first.next_cursor, size=10))
+    assert [i['id'] for i in second.items] == list(range(15, 5, -1))
+
+    back = await paginate_query_by_cursor(sdb, query, CursorParams(cursor=second.prev_cursor, size=10))
+    assert back.items == first.items
+    assert back.prev_cursor is None
+
+
+async def test_paginate_query_by_cursor_mixed_order(sdb):
+    query = select(item_table).order_by(item_table.c.score.desc(), item_table.c.id)
+    expected = sorted(range(1, 26), key=lambda i: (-(i % 3), i))
+    seen, cursor = [], None
+    while True:
+        page = await paginate_query_by_cursor(sdb, query, CursorParams(cursor=cursor, size=7))
+        seen += [i['id'] for i in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+async def test_bulk_insert_and_upsert(sdb):
+    inserted = await bulk_insert(sdb, item_table, [dict(name=f'new-{i}', score=9) for i in range(7)], chunk_size=3)
+    assert inserted == 7
+    new_ids = (await sdb.scalars(select(item_table.c.id).where(item_table.c.score == 9))).all()
+    assert len(set(new_ids)) == 7
+
+    rows = [dict(id=1, name='changed', score=1), dict(id=100, name='item-100', score=1)]
+    await bulk_upsert(sdb, item_table, rows, update_fields=['name'])
+    names = dict(
+        (await sdb.execute(select(item_table.c.id, item_table.c.name).where(item_table.c.id.in_([1, 100])))).all()
+    )
+    assert names == {1: 'changed', 100: 'item-100'}
+
+    # 不更新任何字段时只插入不存在的行
+    rows = [dict(id=1, name='ignored', score=1), dict(id=101, name='item-101', score=1)]
+    await bulk_upsert(sdb, item_table, rows, update_fields=[])
+    names = dict(
+        (await sdb.execute(select(item_table.c.id, item_table.c.name).where(item_table.c.id.in_([1, 101])))).all()
+    )
+    assert names == {1: 'changed', 101: 'item-101'}
+    with pytest.raises(ValueError, match='not supported'):
+        _upsert_statement('oracle', item_table, ['id'], ['name'])
+
+
+async def test_bulk_insert_with_ids(sdb, monkeypatch):
+    import utils.query as query_module
+
+    def lease_lost(n):
+        raise Exception('Worker id lease lost. Refusing to generate id.')
+
+    # 所有行都已有主键时不需要生成 ID
+    monkeypatch.setattr(query_module, 'get_next_ids', lease_lost)
+    assert await bulk_insert(sdb, item_table, [dict(id=200 + i, name='x', score=0) for i in range(3)]) == 3
+    with pytest.raises(Exception, match='lease lost'):
+        await bulk_insert(sdb, item_table, [dict(id=300, name='x'), dict(name='y')])
+
+
+async def test_get_parsed_many_outer_join():
+    from sqlalchemy import ForeignKey
+    from sqlalchemy.orm import declarative_base
+
+    Base = declarative_base()
+
+    class Author(Base):
+        __tablename__ = 'author'
+        id = Column(Integer, primary_key=True)
+        name = Column(String(32))
+
+        def to_dict(self):
+            return dict(id=self.id, name=self.name)
+
+    class Book(Base):
+        __tablename__ = 'book'
+        book_id = Column(Integer, primary_key=True)
+        author_id = Column(Integer, ForeignKey('author.id'))
+
+        def to_dict(self):
+            return dict(book_id=self.book_id, author_id=self.author_id)
+
+    engine = create_async_engine('sqlite+aiosqlite:///:memory:')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, class_=AsyncSession)() as db:
+        db.add_all([Author(id=1, name='a'), Author(id=2, name='b'), Book(book_id=10, author_id=2)])
+        await db.flush()
+        # 首行的 Book 为 None，之后的行按同一结构解析
+        query = (
+            select(Author, Book, Author.name.label('label'))
+            .outerjoin(Book, Book.author_id == Author.id)
+            .order_by(Author.id)
+        )
+        items = await get_parsed_many(db, query)
+        assert items == [
+            dict(id=1, name='a', label='a'),
+            dict(id=2, name='b', book_id=10, author_id=2, label='b'),
+        ]
+        batches = [batch async for batch in stream_parsed_many(db, query, yield_per=1)]
+        assert sum(batches, []) == items
+    await engine.dispose()
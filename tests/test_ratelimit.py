@@ -0,0 +1,72 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils import ratelimit
+
+
+async def _eval(rds, script, keys, *args):
+    return await rds.eval(script, len(keys), *keys, *args)
+
+
+async def test_sliding_window_script(fake_redis):
+    script, keys = ratelimit.SLIDING_WINDOW_SCRIPT, ['k:10', 'k:9']
+    # 上限 3，窗口 1000 毫秒，返回 [是否放行, 剩余额度, 多少毫秒后重试]
+    results = [await _eval(fake_redis, script, keys, 3, 1000, 10000, 0) for _ in range(4)]
+    assert results == [[1, 2, 0], [1, 1, 0], [1, 0, 0], [0, 0, 1000]]
+
+    # 本地放行的请求数计入当前窗口
+    assert await _eval(fake_redis, script, ['a:10', 'a:9'], 3, 1000, 10000, 2) == [1, 0, 0]
+    assert await fake_redis.get('a:10') == '3'
+    assert await _eval(fake_redis, script, ['b:10', 'b:9'], 3, 1000, 10000, 3) == [0, 0, 1000]
+
+    # 上一窗口的请求数按剩余时间占比加权，重试时间为加权后降到上限以下的时间
+    await fake_redis.set('c:9', 4)
+    assert await _eval(fake_redis, script, ['c:10', 'c:9'], 3, 1000, 10500, 0) == [1, 0, 0]
+    assert await _eval(fake_redis, script, ['c:10', 'c:9'], 3, 1000, 10500, 0) == [0, 0, 250]
+    assert 0 < await fake_redis.pttl('c:10') <= 2000
+
+
+async def test_token_bucket_script(fake_redis):
+    script, keys = ratelimit.TOKEN_BUCKET_SCRIPT, ['t']
+    # 容量 2，每毫秒补充 0.002 个令牌
+    results = [await _eval(fake_redis, script, keys, 2, 0.002, 1000, 0) for _ in range(3)]
+    assert results == [[1, 1, 0], [1, 0, 0], [0, 0, 500]]
+    # 250 毫秒后补充了半个令牌，仍需等待 250 毫秒
+    assert await _eval(fake_redis, script, keys, 2, 0.002, 1250, 0) == [0, 0, 250]
+    # 补满后不超过容量
+    assert await _eval(fake_redis, script, keys, 2, 0.002, 5000, 0) == [1, 1, 0]
+    assert await fake_redis.hgetall('t') == dict(tokens='1', ts='5000')
+
+    # 本地放行的请求数从令牌中扣除，桶在补满所需的时间后过期
+    assert await _eval(fake_redis, script, ['u'], 2, 0.002, 1000, 1) == [1, 0, 0]
+    assert await _eval(fake_redis, script, ['v'], 2, 0.002, 1000, 2) == [0, 0, 500]
+    assert 0 < await fake_redis.pttl('u') <= 1000
+
+
+def test_rate_limit(fake_redis, monkeypatch):
+    monkeypatch.setattr(ratelimit.settings, 'WEB_WORKERS', 1)
+    app = FastAPI()
+    app.add_middleware(
+        ratelimit.RateLimitMiddleware,
+        enabled=True,
+        algorithm='token_bucket',
+        key_by=('ip', 'route'),
+        requests=20,
+        window=60,
+        local_ratio=0.5,
+    )
+
+    @app.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        return item_id
+
+    client = TestClient(app)
+    checks = ratelimit.get_rate_limit_stats()['redis_checks']
+    codes = [client.get(f'/items/{i}').status_code for i in range(30)]
+    # 路径参数不同的请求按同一路由计数，本地额度内的请求不访问 redis
+    assert codes == [200] * 20 + [429] * 10
+    assert ratelimit.get_rate_limit_stats()['redis_checks'] - checks < 20
+    resp = client.get('/items/1')
+    assert resp.json() == dict(code=429, msg='请求过于频繁，请稍后重试', data=None)
+    # 每 3 秒补充一个令牌
+    assert resp.headers['Retry-After'] == '3'
@@ -0,0 +1,122 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import List
+
+from fastapi import APIRouter, FastAPI, Response
+from fastapi.testclient import TestClient
+
+from schemas.common import SuccessResponse
+from pydantic import BaseModel, ConfigDict, Field
+
+from utils.response import FastJSONRoute, csv_streaming_response, ndjson_streaming_response
+
+
+class UserModel(BaseModel):
+    user_id: int = Field(alias='userId')
+    tags: set
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+def test_fast_json_route():
+    app = FastAPI()
+    router = APIRouter(route_class=FastJSONRoute)
+
+    @router.post('/untyped', status_code=201)
+    async def untyped():
+        return SuccessResponse.make(dict(price=Decimal('1.50'), ids=[1, 2]))
+
+    @router.get('/raw')
+    def raw():
+        return dict(price=Decimal('2.50'))
+
+    @router.get('/alias')
+    async def alias():
+        return UserModel(user_id=1, tags={'a'})
+
+    @router.get('/set')
+    def set_value():
+        return dict(tags={'a'}, user=UserModel(user_id=2, tags=set()))
+
+    @router.get('/typed')
+    def typed() -> SuccessResponse[int]:
+        return SuccessResponse.make('1')
+
+    @router.get('/header')
+    async def header(response: Response):
+        response.headers['X-Test'] = '1'
+        return SuccessResponse.make(None)
+
+    app.include_router(router)
+    assert [route.fast_path for route in router.routes] == [True, True, True, True, False, False]
+
+    client = TestClient(app)
+    resp = client.post('/untyped')
+    assert resp.status_code == 201
+    assert resp.json() == dict(code=0, msg='操作成功', data=dict(price='1.50', ids=[1, 2]))
+    assert client.get('/raw').json() == dict(price='2.50')
+    # 与 FastAPI 默认的处理一致：模型按别名输出，set 等 orjson 不支持的类型由 pydantic 转换
+    assert client.get('/alias').json() == dict(userId=1, tags=['a'])
+    assert client.get('/set').json() == dict(tags=['a'], user=dict(userId=2, tags=[]))
+    # 声明了响应模型的接口仍然按响应模型校验和转换
+    assert client.get('/typed').json()['data'] == 1
+    assert client.get('/header').headers['X-Test'] == '1'
+
+
+def test_typed_route_dump_json(monkeypatch):
+    """应用中声明了响应模型的接口仍由 FastAPI 直接序列化为 JSON（dump_json），不被默认响应类关闭"""
+    import fastapi.routing
+    from main import app
+
+    calls = []
+    serialize_response = fastapi.routing.serialize_response
+
+    async def spy(**kwargs):
+        calls.append(kwargs['dump_json'])
+        return await serialize_response(**kwargs)
+
+    monkeypatch.setattr(fastapi.routing, 'serialize_response', spy)
+    resp = TestClient(app).get('/hello')
+    assert resp.json()['data'] == 'fastapi-template!'
+    assert calls == [True]
+
+
+class ExportItem(BaseModel):
+    id: int
+    name: str
+    created: datetime
+    price: Decimal
+    tags: List[str]
+
+
+def test_streaming_responses():
+    rows = [
+        dict(id=1, name='一', created=datetime(2020, 1, 1), price=Decimal('1.50'), tags=['a', 'b']),
+        ExportItem(id=2, name='二', created=datetime(2020, 1, 2), price=Decimal('2'), tags=[]),
+    ]
+
+    async def batches():
+        # 字典和模型混合，输出格式应一致
+        yield rows[:1]
+        yield []
+        yield rows[1:]
+
+    app = FastAPI()
+    app.get('/ndjson')(lambda: ndjson_streaming_response(batches(), filename='导出.ndjson'))
+    app.get('/csv')(lambda: csv_streaming_response(batches(), fieldnames=['id', 'created', 'price', 'tags']))
+    client = TestClient(app)
+
+    resp = client.get('/ndjson')
+    assert resp.headers['content-type'] == 'application/x-ndjson'
+    assert "filename*=utf-8''%E5%AF%BC%E5%87%BA.ndjson" in resp.headers['content-disposition']
+    assert resp.text.splitlines() == [
+        '{"id":1,"name":"一","created":"2020-01-01T00:00:00","price":"1.50","tags":["a","b"]}',
+        '{"id":2,"name":"二","created":"2020-01-02T00:00:00","price":"2","tags":[]}',
+    ]
+
+    resp = client.get('/csv')
+    assert resp.text.splitlines() == [
+        'id,created,price,tags',
+        '1,2020-01-01T00:00:00,1.50,"[""a"",""b""]"',
+        '2,2020-01-02T00:00:00,2,[]',
+    ]
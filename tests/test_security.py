@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from utils.errors import Http503ServiceUnavailable
+
+
+@pytest.mark.asyncio
+async def test_async_password_hash():
+    from utils.security import async_get_password_hash, async_verify_password, verify_password
+
+    hashed = await async_get_password_hash('secret')
+    assert verify_password('secret', hashed)
+    assert await async_verify_password('secret', hashed)
+    assert not await async_verify_password('wrong', hashed)
+
+
+@pytest.mark.asyncio
+async def test_password_hash_queue_limit(monkeypatch):
+    from config import settings
+    from utils import security
+
+    # 信号量按并发数创建，重置后使用测试指定的并发数
+    monkeypatch.setattr(settings, 'PASSWORD_HASH_WORKERS', 2)
+    monkeypatch.setattr(settings, 'PASSWORD_HASH_MAX_PENDING', 1)
+    monkeypatch.setattr(security, '__hash_semaphore', None)
+    before = security.get_password_hash_stats()
+    results = await asyncio.gather(
+        *[security.async_get_password_hash('secret') for _ in range(8)], return_exceptions=True
+    )
+    rejected = [r for r in results if isinstance(r, Http503ServiceUnavailable)]
+    # 并发数为 2，排队 1 个，其余直接拒绝
+    assert len(rejected) == 5
+    stats = security.get_password_hash_stats()
+    assert stats['rejected'] - before['rejected'] == 5 and stats['completed'] - before['completed'] == 3
+    assert stats['waiting'] == stats['running'] == 0
+
+
+@pytest.mark.asyncio
+async def test_password_hash_failed():
+    from utils import security
+
+    def fail(password):
+        raise ValueError(password)
+
+    before = security.get_password_hash_stats()
+    with pytest.raises(ValueError):
+        await security._run_in_hash_executor(fail, 'secret')
+    stats = security.get_password_hash_stats()
+    # 出错的哈希只计入 failed，并释放信号量
+    assert stats['failed'] - before['failed'] == 1 and stats['completed'] == before['completed']
+    assert stats['running'] == 0
+    assert not security._get_hash_semaphore().locked()
+
+
+def test_password_hash_across_loops(monkeypatch):
+    """不同事件循环中并发哈希，信号量不会绑定到之前的事件循环"""
+    from config import settings
+    from utils import security
+
+    monkeypatch.setattr(settings, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setattr(security, '__hash_semaphore', None)
+
+    async def hash_many():
+        return await asyncio.gather(*[security.async_get_password_hash('secret') for _ in range(3)])
+
+    for _ in range(2):
+        assert all(security.verify_password('secret', hashed) for hashed in asyncio.run(hash_many()))
+
+
+@pytest.mark.asyncio
+async def test_authenticate_token(fake_redis, monkeypatch):
+    from utils import security
+
+    monkeypatch.setattr(security.settings, 'TOKEN_DENYLIST_CHECK_INTERVAL', 0)
+    token, other = security.create_atk(1), security.create_atk(2)
+    assert security.verify_token(token) == 1
+    assert await security.authenticate_token(token) == 1
+    assert security.verify_token('bad.token') is None
+    assert security.verify_token(security.jwt.encode(dict(sub='x'), security.JWT_SECRET_KEY)) is None
+
+    await security.revoke_token(token)
+    assert await security.authenticate_token(token) is None
+    # 清空本地缓存后仍由 redis 中的吊销记录拒绝
+    security._token_cache.clear()
+    assert await security.authenticate_token(token) is None
+
+    await security.revoke_user_tokens(2)
+    security._token_cache.clear()
+    assert await security.authenticate_token(other) is None
+
+
+def test_jwks_rotation(monkeypatch, tmp_path):
+    import json
+
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    from utils import security
+
+    def make_jwk(kid, key, algorithm):
+        return dict(security.jwt.get_algorithm_by_name(algorithm).to_jwk(key, as_dict=True), kid=kid, alg=algorithm)
+
+    old = make_jwk('old', ec.generate_private_key(ec.SECP256R1()), 'ES256')
+    new = make_jwk('new', ed25519.Ed25519PrivateKey.generate(), 'EdDSA')
+    path = tmp_path / 'jwks.json'
+    monkeypatch.setattr(security.settings, 'JWT_JWKS_PATH', str(path))
+    monkeypatch.setattr(security.settings, 'JWT_SIGNING_KID', 'old')
+    monkeypatch.setattr(security, 'jwt_keys', security.jwt_keys)
+    path.write_text(json.dumps(dict(keys=[old, new])))
+    security.reload_jwt_keys()
+    old_token = security.create_atk(1)
+    assert security.jwt.get_unverified_header(old_token)['kid'] == 'old'
+
+    # 切换签名密钥后旧令牌仍可验签
+    monkeypatch.setattr(security.settings, 'JWT_SIGNING_KID', 'new')
+    security.reload_jwt_keys()
+    new_token = security.create_atk(2)
+    assert security.verify_token(old_token) == 1 and security.verify_token(new_token) == 2
+    public_jwks = security.jwt_keys.get_public_jwks()
+    assert {k['kid'] for k in public_jwks['keys']} == {'old', 'new'}
+    assert all('d' not in k for k in public_jwks['keys'])
+
+    # 移除旧密钥后旧令牌失效
+    path.write_text(json.dumps(dict(keys=[new])))
+    security.reload_jwt_keys()
+    assert security.verify_token(old_token) is None and security.verify_token(new_token) == 2
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+
+def test_concurrent_get_next_ids():
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.snowflake import get_next_id, get_next_ids
+
+    # 批量数量超过单毫秒的序列号上限，需要跨毫秒
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(get_next_ids, [5000] * 8))
+    id_list = [i for batch in batches for i in batch] + [get_next_id() for _ in range(100)]
+    assert len(id_list) == len(set(id_list)) == 40100
+    assert all(list(batch) == sorted(batch) for batch in batches)
+
+
+def test_thread_local_generator():
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.snowflake import ThreadLocalGenerator
+
+    # 3 个线程独占子标识，其余线程共用子标识 0
+    generator = ThreadLocalGenerator(4, 1, slot_bits=2)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        batches = list(executor.map(lambda _: [generator.generate_id() for _ in range(1000)], range(64)))
+    id_list = [i for batch in batches for i in batch]
+    assert len(id_list) == len(set(id_list))
+    assert {(i >> 12) & 0x1F for i in id_list} <= {4, 5, 6, 7}
+
+
+def test_clock_skew(monkeypatch):
+    from utils import snowflake
+
+    generator = snowflake.UniqueIDGenerator(1, sequence_bits=2, max_clock_skew=10)
+    now = [snowflake._current_timestamp()]
+    monkeypatch.setattr(snowflake, '_current_timestamp', lambda: now[0])
+    id_list = [generator.generate_id() for _ in range(3)]
+    # 时钟回拨时沿用上次的时间戳，序列号用尽后借用下一毫秒
+    now[0] -= 5
+    id_list += [generator.generate_id() for _ in range(6)]
+    assert id_list == sorted(set(id_list))
+    now[0] -= 20
+    with pytest.raises(Exception, match='Clock moved backwards'):
+        generator.generate_id()
+
+
+@pytest.fixture
+async def lease_redis(fake_redis, monkeypatch):
+    from utils import snowflake
+
+    monkeypatch.setattr(snowflake, 'generator', snowflake.ThreadLocalGenerator(0, 0, **snowflake.LAYOUT))
+    monkeypatch.setattr(snowflake, '_lease', snowflake._WorkerLease())
+    monkeypatch.setattr(snowflake.settings, 'SNOWFLAKE_WORKER_ID', None)
+    monkeypatch.setattr(snowflake.settings, 'SNOWFLAKE_DATA_CENTER_ID', None)
+    # 续约间隔为有效期的 1/3
+    monkeypatch.setattr(snowflake.settings, 'SNOWFLAKE_LEASE_TTL', 0.06)
+    yield fake_redis
+    await snowflake.release_worker_lease()
+
+
+def _get_slot(key: str) -> int:
+    from utils import snowflake
+
+    return int(key[len(snowflake.LEASE_KEY_PREFIX) :])
+
+
+async def test_worker_lease(lease_redis, monkeypatch):
+    from utils import snowflake
+
+    # 由进程号推导的标识已被占用时占用下一个
+    start = snowflake.os.getpid() % snowflake.SLOT_COUNT
+    await lease_redis.set(f'{snowflake.LEASE_KEY_PREFIX}{start}', 'other')
+    await snowflake.acquire_worker_lease()
+    slot = _get_slot(snowflake._lease.key)
+    assert slot == (start + 1) % snowflake.SLOT_COUNT
+    shared = snowflake.generator.shared
+    assert divmod(slot, snowflake.WORKER_COUNT) == (shared.data_center_id, shared.worker_id)
+    assert (snowflake.get_next_id() >> shared.worker_id_shift) & shared.max_worker_id == shared.worker_id
+
+    # 定期续约，超过有效期后租约仍然有效，有效期随之延长
+    expires_at = shared.lease_expires_at
+    await asyncio.sleep(0.08)
+    assert await lease_redis.get(snowflake._lease.key) == snowflake._lease.token
+    assert shared.lease_expires_at > expires_at
+
+    # 租约被其他进程占用时重新占用空闲的标识
+    await lease_redis.set(snowflake._lease.key, 'other')
+    await asyncio.sleep(0.03)
+    assert _get_slot(snowflake._lease.key) == (start + 2) % snowflake.SLOT_COUNT
+    assert shared.worker_id == (start + 2) % snowflake.SLOT_COUNT % snowflake.WORKER_COUNT
+
+    # 关闭时释放租约
+    key = snowflake._lease.key
+    await snowflake.release_worker_lease()
+    assert not await lease_redis.exists(key) and snowflake._lease.key is None and snowflake._lease.task is None
+
+
+async def test_worker_lease_expired(lease_redis, fake_redis_server):
+    from utils import snowflake
+
+    await snowflake.acquire_worker_lease()
+    snowflake.get_next_id()
+    # redis 不可用无法续约，租约过期后拒绝生成 ID
+    fake_redis_server.connected = False
+    await asyncio.sleep(0.08)
+    with pytest.raises(Exception, match='lease lost'):
+        snowflake.get_next_id()
+    with pytest.raises(Exception, match='lease lost'):
+        snowflake.get_next_ids(10)
+    # 恢复后续约成功，继续生成 ID
+    fake_redis_server.connected = True
+    await asyncio.sleep(0.03)
+    assert snowflake.get_next_id()
+
+
+async def test_worker_lease_data_center(lease_redis, monkeypatch):
+    from utils import snowflake
+
+    monkeypatch.setattr(snowflake.settings, 'SNOWFLAKE_DATA_CENTER_ID', 3)
+    # 该数据中心的机器标识全部被占用后不会占用其他数据中心的标识
+    for worker_id in range(snowflake.WORKER_COUNT - 1):
+        await lease_redis.set(f'{snowflake.LEASE_KEY_PREFIX}{3 * snowflake.WORKER_COUNT + worker_id}', 'other')
+    await snowflake.acquire_worker_lease()
+    assert _get_slot(snowflake._lease.key) == 4 * snowflake.WORKER_COUNT - 1
+    assert snowflake.generator.shared.data_center_id == 3
+
+    await snowflake.release_worker_lease()
+    await lease_redis.set(f'{snowflake.LEASE_KEY_PREFIX}{4 * snowflake.WORKER_COUNT - 1}', 'other')
+    with pytest.raises(RuntimeError, match='No free snowflake worker slot'):
+        await snowflake.acquire_worker_lease()
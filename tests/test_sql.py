@@ -0,0 +1,164 @@
+import itertools
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, exc, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+from config import settings
+from utils.connect import sql
+
+_metadata = MetaData()
+node_table = Table('node', _metadata, Column('id', Integer, primary_key=True), Column('name', String(32)))
+
+
+async def _create_engine(path, name: str):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    async with engine.begin() as conn:
+        await conn.run_sync(_metadata.create_all)
+        await conn.execute(insert(node_table).values(id=1, name=name))
+    return engine
+
+
+@pytest.fixture
+async def engines(tmp_path, monkeypatch):
+    """主库和从库，各自写入一行标识自身的数据"""
+    primary = await _create_engine(tmp_path / 'primary.db', 'primary')
+    replica = await _create_engine(tmp_path / 'replica.db', 'replica')
+    monkeypatch.setattr(sql, 'replica_engines', [replica])
+    monkeypatch.setattr(sql, '_replica_cycle', itertools.cycle([replica]))
+    # 测试配置不包含 mysql 配置项
+    monkeypatch.setitem(vars(settings), 'MYSQL_REPLICA_STRATEGY', 'round_robin')
+    monkeypatch.setitem(vars(settings), 'MYSQL_READ_YOUR_WRITES_WINDOW', 5)
+    yield primary, replica
+    await primary.dispose()
+    await replica.dispose()
+
+
+def _make_session(engine, request_state: dict, use_replica: bool = True) -> AsyncSession:
+    info = dict(use_replica=use_replica, request_state=request_state)
+    return AsyncSession(bind=engine, sync_session_class=sql.RoutingSession, info=info)
+
+
+async def _read_name(db: AsyncSession) -> str:
+    return (await db.execute(select(node_table.c.name).where(node_table.c.id == 1))).scalar()
+
+
+async def test_routing_session(engines):
+    primary, replica = engines
+    request_state = {}
+    async with _make_session(primary, request_state) as db:
+        assert await _read_name(db) == 'replica'
+        await db.execute(insert(node_table).values(id=2, name='written'))
+        # 写入走主库，之后会话内的查询也走主库
+        assert await _read_name(db) == 'primary'
+        await db.commit()
+    async with primary.connect() as conn:
+        assert (await conn.execute(select(node_table.c.name).where(node_table.c.id == 2))).scalar() == 'written'
+
+    # 同一请求内写入后的其他会话在窗口期内读主库
+    async with _make_session(primary, request_state) as db:
+        assert await _read_name(db) == 'primary'
+    async with _make_session(primary, {}) as db:
+        assert await _read_name(db) == 'replica'
+    # 不使用从库的会话沿用指定的 bind
+    async with _make_session(replica, {}, use_replica=False) as db:
+        assert await _read_name(db) == 'replica'
+
+
+async def test_request_state_reset():
+    async with sql.get_async_db(lazy=True):
+        assert sql._request_state.get() is not None
+        async with sql.get_async_db(lazy=True):
+            pass
+        assert sql._request_state.get() is not None
+    assert sql._request_state.get() is None
+
+
+class Node(declarative_base(metadata=_metadata)):
+    __table__ = node_table
+
+
+@pytest.mark.parametrize('mode', ['orm', 'core', 'text', 'driver_sql', 'read_only'])
+async def test_lazy_session_commits_writes(tmp_path, mode):
+    engine = await _create_engine(tmp_path / 'lazy.db', 'primary')
+    async with _make_session(engine, {}, use_replica=False) as db:
+        if mode == 'orm':
+            db.add(Node(id=2, name='orm'))
+            await db.flush()
+        elif mode == 'core':
+            await db.execute(insert(node_table).values(id=2, name='core'))
+        elif mode == 'text':
+            await db.execute(text("INSERT INTO node (id, name) VALUES (2, 'text')"))
+        elif mode == 'driver_sql':
+            conn = await db.connection()
+            await conn.exec_driver_sql("INSERT INTO node (id, name) VALUES (2, 'driver_sql')")
+        else:
+            await _read_name(db)
+        await sql.release_db(db)
+        assert not db.in_transaction()
+    async with engine.connect() as conn:
+        count = (await conn.execute(select(func.count()).select_from(node_table))).scalar()
+    assert count == (1 if mode == 'read_only' else 2)
+    await engine.dispose()
+
+
+@pytest.mark.parametrize('write', [True, False])
+async def test_release_db_keeps_loaded_state(tmp_path, monkeypatch, write):
+    engine = await _create_engine(tmp_path / 'release.db', 'primary')
+    monkeypatch.setattr(sql, 'AsyncSessionLocal', async_sessionmaker(**dict(sql.AsyncSessionLocal.kw, bind=engine)))
+    async with sql.get_async_db(lazy=True) as db:
+        node = await db.get(Node, 1)
+        if write:
+            node.name = 'written'
+        await sql.release_db(db)
+        assert not db.in_transaction()
+        # 提前归还连接后仍可读取已加载的属性用于序列化
+        assert node.name == ('written' if write else 'primary')
+    async with engine.connect() as conn:
+        assert (await conn.execute(select(node_table.c.name))).scalar() == ('written' if write else 'primary')
+    await engine.dispose()
+
+
+@pytest.mark.parametrize(
+    'auto_size, workers, expected',
+    [(False, 4, (5, 10)), (True, 4, (23, 12)), (True, 100, (1, 0)), (True, 200, (1, 0))],
+)
+def test_pool_size(monkeypatch, caplog, auto_size, workers, expected):
+    options = dict(
+        MYSQL_POOL_AUTO_SIZE=auto_size,
+        MYSQL_POOL_SIZE=5,
+        MYSQL_MAX_OVERFLOW=10,
+        MYSQL_MAX_CONNECTIONS=151,
+        MYSQL_RESERVED_CONNECTIONS=10,
+        WEB_WORKERS=workers,
+    )
+    for name, value in options.items():
+        monkeypatch.setitem(vars(settings), name, value)
+    with caplog.at_level('WARNING', logger=sql.sql_logger.name):
+        pool_size, max_overflow = sql._get_pool_size()
+    assert (pool_size, max_overflow) == expected
+    if not auto_size:
+        return
+    # 所有 worker 的连接总数不超过预算，预算不足每个 worker 一个连接时记录警告
+    over_budget = workers > 151 - 10
+    assert (workers * (pool_size + max_overflow) <= 151 - 10) != over_budget
+    assert any('connection budget' in record.getMessage() for record in caplog.records) == over_budget
+
+
+async def test_timed_queue_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(sql.TimedQueuePool, 'stats', dict(checkouts=0, timeouts=0, wait_total=0.0, wait_max=0.0))
+    engine = create_async_engine(
+        f'sqlite+aiosqlite:///{tmp_path / "pool.db"}', poolclass=sql.TimedQueuePool, pool_size=1, max_overflow=0
+    )
+    engine.pool._timeout = 0.05
+    async with engine.connect() as conn:
+        await conn.execute(select(1))
+        # 唯一的连接已被签出，再次签出超时
+        with pytest.raises(exc.TimeoutError):
+            async with engine.connect():
+                pass
+    stats = sql.TimedQueuePool.stats
+    assert stats['checkouts'] == 2 and stats['timeouts'] == 1
+    assert stats['wait_max'] >= 0.05
+    await engine.dispose()
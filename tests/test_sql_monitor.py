@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+
+def test_normalize_sql():
+    from utils.connect.monitor import normalize_sql
+
+    assert normalize_sql("SELECT *\n  FROM t WHERE a = 'x' AND b IN (?, ?, ?) LIMIT 10") == (
+        'SELECT * FROM t WHERE a = ? AND b IN (?...) LIMIT ?'
+    )
+    assert normalize_sql('SELECT * FROM t1 WHERE id IN (%s)') == normalize_sql('SELECT * FROM t1 WHERE id IN (%s, %s)')
+
+
+def test_slow_and_repeated_queries(temp_db, monkeypatch):
+    from config import settings
+    from utils.connect import get_async_db
+    from utils.context import RequestStats, request_stats_var
+    from utils.logger import sql_logger
+
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    async def run():
+        request_stats_var.set(stats)
+        async with get_async_db() as db:
+            for i in range(3):
+                await db.execute(text('SELECT :value'), dict(value=i))
+
+    stats = RequestStats()
+    monkeypatch.setattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 3)
+    monkeypatch.setattr(settings, 'SQL_SLOW_THRESHOLD', 0)
+    handler = ListHandler()
+    sql_logger.addHandler(handler)
+    try:
+        asyncio.run(run())
+    finally:
+        sql_logger.removeHandler(handler)
+    assert stats.db_statements['SELECT ?'] == 3
+    messages = [record.getMessage() for record in records]
+    assert sum(message.startswith('Possible N+1 query') for message in messages) == 1
+    assert 'Slow query' in messages[0] and 'params=(int)' in messages[0]
+
+
+def test_explain_skips_streaming(temp_db, monkeypatch):
+    from config import settings
+    from utils.connect import get_async_db
+    from utils.logger import sql_logger
+
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    async def run():
+        async with get_async_db() as db:
+            await db.execute(text('SELECT 1'))
+            result = await db.stream(text('SELECT 2'))
+            return await result.scalars().all()
+
+    monkeypatch.setattr(type(settings), 'IS_DEV', True)
+    monkeypatch.setattr(settings, 'SQL_EXPLAIN_SLOW', True)
+    monkeypatch.setattr(settings, 'SQL_SLOW_THRESHOLD', 0)
+    handler = ListHandler()
+    sql_logger.addHandler(handler)
+    try:
+        assert asyncio.run(run()) == [2]
+    finally:
+        sql_logger.removeHandler(handler)
+    messages = [record.getMessage() for record in records if 'Slow query' in record.getMessage()]
+    # 普通查询附带 EXPLAIN，流式查询不执行 EXPLAIN，避免丢弃未读取的结果
+    assert len(messages) == 2 and 'EXPLAIN' in messages[0] and 'EXPLAIN' not in messages[1]
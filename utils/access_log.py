@@ -0,0 +1,90 @@
+import re
+import time
+import uuid
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from utils.context import RequestStats, request_id_var, request_stats_var
+from utils.logger import access_logger
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# 只接受长度和字符受限的外部请求 ID，避免日志注入
+_REQUEST_ID_PATTERN = re.compile(r'[\w.\-]{1,64}')
+
+
+class AccessLogMiddleware:
+    """
+    为每个请求分配 ID（沿用请求头中的 X-Request-ID）并在响应头中返回，请求内的日志都带有该 ID
+    请求结束时记录一条访问日志：方法、路由模板、状态码、总耗时以及数据库和 redis 的耗时与次数
+    """
+
+    def __init__(self, app: ASGIApp, enabled: bool = settings.ACCESS_LOG_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        # 每个请求在独立的任务中处理，上下文变量不会影响其他请求，
+        # 处理结束后也不重置，外层 ServerErrorMiddleware 调用异常处理函数记录的日志仍带有请求 ID
+        request_id = _get_request_id(scope)
+        request_id_var.set(request_id)
+        stats = RequestStats()
+        request_stats_var.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if self.enabled:
+                _log_access(scope, status_code, time.perf_counter() - start, stats)
+
+
+def _get_request_id(scope: Scope) -> str:
+    for name, value in scope['headers']:
+        if name == b'x-request-id':
+            request_id = value.decode('latin-1')
+            if _REQUEST_ID_PATTERN.fullmatch(request_id):
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+def get_route_template(scope: Scope) -> str:
+    """路由之后的路由模板（包含 include_router 的前缀），未匹配到接口时返回请求路径"""
+    context = scope.get('fastapi', {}).get('effective_route_context')
+    return getattr(context, 'path', None) or getattr(scope.get('route'), 'path', None) or scope['path']
+
+
+def _log_access(scope: Scope, status_code: int, elapsed: float, stats: RequestStats):
+    route = get_route_template(scope)
+    client = scope.get('client')
+    access_logger.info(
+        f'{scope["method"]} {route} {status_code} {elapsed * 1000:.1f}ms '
+        f'db={stats.db_count}/{stats.db_time * 1000:.1f}ms redis={stats.redis_count}/{stats.redis_time * 1000:.1f}ms',
+        extra=dict(
+            method=scope['method'],
+            path=scope['path'],
+            route=route,
+            status=status_code,
+            duration_ms=round(elapsed * 1000, 3),
+            db_ms=round(stats.db_time * 1000, 3),
+            db_count=stats.db_count,
+            redis_ms=round(stats.redis_time * 1000, 3),
+            redis_count=stats.redis_count,
+            client=client[0] if client else None,
+        ),
+    )
+
+
+__all__ = ['AccessLogMiddleware', 'REQUEST_ID_HEADER', 'get_route_template']
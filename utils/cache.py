@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Type, List, Union, Dict, Tuple, Iterable, Callable, Awaitable, Any
+
+import orjson
+from redis import RedisError
+from sqlalchemy import Select, Table, TextClause, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session
+from sqlalchemy.sql.util import find_tables
+
+from config import settings
+from schemas.common import T_BaseModel, PageParams, PaginateResult
+from utils import query as q
+from utils.connect import get_async_redis_connection
+from utils.logger import logger
+from utils.response import orjson_dumps
+
+# 标签集合的过期时间，缓存的 ttl 不能超过该值，否则标签过期后缓存无法被失效
+TAG_TTL = 24 * 60 * 60
+
+
+class QueryCache:
+    """
+    查询结果缓存
+    本地 LRU（L1，短 ttl）+ redis（L2），以编译后的 SQL 和参数为键，以查询涉及的表名为标签，
+    通过会话提交或 invalidate 按表失效，相同键的并发未命中只会查询一次数据库
+    会话中有未提交的写入时不读写缓存，直接查询数据库，避免缓存未提交（可能回滚）的数据
+    每张表有一个代数，失效时加一：redis 中的缓存值带有写入时各表的代数，与当前代数不一致即视为未命中；
+    本进程内加载期间表的代数变化时不写入缓存，失效前开始的查询不会在失效后写入旧数据
+    """
+
+    def __init__(self, prefix: str = 'cache:query:', l1_size: int = 1024, l1_ttl: float = 5):
+        self.prefix = prefix
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.stats = dict(l1_hits=0, hits=0, misses=0, bypassed=0, errors=0)
+        # key -> (过期时间, 标签, 序列化后的值)
+        self._l1: OrderedDict[str, Tuple[float, Tuple[str, ...], bytes]] = OrderedDict()
+        # key -> (加载任务, 标签)
+        self._inflight: Dict[str, Tuple[asyncio.Future, Tuple[str, ...]]] = {}
+        # 标签 -> 本进程内的代数
+        self._generations: Dict[str, int] = {}
+
+    async def get_parsed_one(
+        self,
+        db: AsyncSession,
+        query: Select,
+        schema: Type[T_BaseModel] = None,
+        ttl: int = 60,
+    ) -> Optional[Union[T_BaseModel, dict]]:
+        """带缓存的 utils.query.get_parsed_one"""
+        raw = await self._get(db, 'one', query, schema, ttl, lambda: q.get_parsed_one(db, query, schema=schema))
+        value = orjson.loads(raw)
+        return schema.model_validate(value) if schema and value is not None else value
+
+    async def get_parsed_many(
+        self,
+        db: AsyncSession,
+        query: Select,
+        schema: Type[T_BaseModel] = None,
+        ttl: int = 60,
+    ) -> List[Union[T_BaseModel, dict]]:
+        """带缓存的 utils.query.get_parsed_many"""
+        raw = await self._get(db, 'many', query, schema, ttl, lambda: q.get_parsed_many(db, query, schema=schema))
+        values = orjson.loads(raw)
+        return [schema.model_validate(v) for v in values] if schema else values
+
+    async def paginate_query(
+        self,
+        db: AsyncSession,
+        query: Select,
+        page_params: PageParams,
+        schema: Type[T_BaseModel] = None,
+        ttl: int = 60,
+        **kwargs,
+    ) -> PaginateResult[Union[T_BaseModel, dict]]:
+        """带缓存的 utils.query.paginate_query，其余参数原样传递"""
+        extra = (page_params.model_dump_json(), sorted(kwargs.items()))
+        raw = await self._get(
+            db,
+            'page',
+            query,
+            schema,
+            ttl,
+            lambda: q.paginate_query(db, query, page_params, schema=schema, **kwargs),
+            extra,
+        )
+        return PaginateResult[schema or dict].model_validate_json(raw)
+
+    async def invalidate(self, *tables: Union[str, Table]):
+        """按表失效缓存"""
+        tags = {t if isinstance(t, str) else t.name for t in tables}
+        if not tags:
+            return
+        self.invalidate_local(tags)
+        await self.invalidate_remote(tags)
+
+    def invalidate_local(self, tags: Iterable[str]):
+        """增加本进程内各表的代数，移除本地缓存和进行中的加载，之后的请求重新加载"""
+        tags = set(tags)
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        for key, (_, key_tags, _) in list(self._l1.items()):
+            if tags.intersection(key_tags):
+                self._l1.pop(key, None)
+        for key, (_, key_tags) in list(self._inflight.items()):
+            if tags.intersection(key_tags):
+                self._inflight.pop(key, None)
+
+    async def invalidate_remote(self, tags: Iterable[str]):
+        """增加 redis 中各表的代数，使所有进程中带旧代数的缓存失效，并删除已失效的缓存释放内存"""
+        try:
+            rds = await get_async_redis_connection()
+            tag_keys = [self._tag_key(tag) for tag in tags]
+            async with rds.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.incr(self._generation_key(tag))
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                members = (await pipe.execute())[len(tag_keys) :]
+            keys = set().union(*members)
+            await rds.delete(*keys, *tag_keys)
+        except RedisError as e:
+            self.stats['errors'] += 1
+            logger.warning(f'Invalidate query cache failed: {e}')
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, l1_size=len(self._l1), inflight=len(self._inflight))
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self.prefix}tag:{tag}'
+
+    def _generation_key(self, tag: str) -> str:
+        # 代数不设置过期时间，每张表只有一个键，过期后归零会使带旧代数的缓存重新有效
+        return f'{self.prefix}gen:{tag}'
+
+    def _get_generation(self, tags: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _make_key(self, kind: str, db: AsyncSession, query: Select, schema, extra: Any = None) -> str:
+        compiled = query.compile(dialect=db.get_bind().dialect)
+        schema_name = f'{schema.__module__}.{schema.__qualname__}' if schema else ''
+        source = f'{kind}|{schema_name}|{compiled.string}|{sorted(compiled.params.items())!r}|{extra!r}'
+        return self.prefix + hashlib.sha1(source.encode()).hexdigest()
+
+    @staticmethod
+    def _get_tags(query: Select) -> Tuple[str, ...]:
+        return tuple(sorted({t.name for t in find_tables(query, include_aliases=True) if isinstance(t, Table)}))
+
+    def _l1_get(self, key: str) -> Optional[bytes]:
+        entry = self._l1.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._l1.pop(key, None)
+            return None
+        self._l1.move_to_end(key)
+        return entry[2]
+
+    def _l1_set(self, key: str, tags: Tuple[str, ...], raw: bytes, ttl: int):
+        if self.l1_size <= 0:
+            return
+        self._l1[key] = (time.monotonic() + min(ttl, self.l1_ttl), tags, raw)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+    async def _get(
+        self,
+        db: AsyncSession,
+        kind: str,
+        query: Select,
+        schema,
+        ttl: int,
+        loader: Callable[[], Awaitable[Any]],
+        extra: Any = None,
+    ) -> bytes:
+        if _has_pending_writes(db.sync_session):
+            # 查询结果可能包含未提交的数据，不读写缓存
+            self.stats['bypassed'] += 1
+            return orjson_dumps(await loader())
+        return await self._get_or_load(
+            self._make_key(kind, db, query, schema, extra), self._get_tags(query), ttl, loader
+        )
+
+    async def _get_or_load(
+        self,
+        key: str,
+        tags: Tuple[str, ...],
+        ttl: int,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> bytes:
+        raw = self._l1_get(key)
+        if raw is not None:
+            self.stats['l1_hits'] += 1
+            return raw
+        # 相同键的并发请求共用同一次加载
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            future = inflight[0]
+            # 自身被取消时不影响其他请求发起的加载
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+            # 发起加载的请求已被取消，改用自身的会话加载
+            inflight = self._inflight.get(key)
+        future = asyncio.ensure_future(self._load(key, tags, min(ttl, TAG_TTL), loader))
+        self._inflight[key] = (future, tags)
+        future.add_done_callback(lambda _: self._discard_inflight(key, future))
+        # 加载使用发起请求的会话，发起请求被取消时加载一起取消，不再使用正在关闭的会话
+        return await future
+
+    def _discard_inflight(self, key: str, future: asyncio.Future):
+        # 失效后同一键可能已开始新的加载，只移除自身
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] is future:
+            del self._inflight[key]
+
+    async def _load(self, key: str, tags: Tuple[str, ...], ttl: int, loader: Callable[[], Awaitable[Any]]) -> bytes:
+        generation = self._get_generation(tags)
+        rds = header = None
+        try:
+            rds = await get_async_redis_connection()
+            async with rds.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                for tag in tags:
+                    pipe.get(self._generation_key(tag))
+                cached, *generations = await pipe.execute()
+            # 缓存值为 "各表代数\n结果"
+            header = ','.join(str(int(g or 0)) for g in generations).encode()
+            if cached is not None:
+                cached = cached.encode() if isinstance(cached, str) else cached
+                cached_header, _, raw = cached.partition(b'\n')
+                if cached_header == header:
+                    self.stats['hits'] += 1
+                    self._l1_set(key, tags, raw, ttl)
+                    return raw
+        except RedisError as e:
+            self.stats['errors'] += 1
+            logger.warning(f'Read query cache failed: {e}')
+        self.stats['misses'] += 1
+        raw = orjson_dumps(await loader())
+        if self._get_generation(tags) != generation:
+            # 加载期间表已被修改，结果可能是旧数据，不写入缓存
+            return raw
+        self._l1_set(key, tags, raw, ttl)
+        if header is not None:
+            try:
+                async with rds.pipeline(transaction=False) as pipe:
+                    pipe.set(key, header + b'\n' + raw, ex=ttl)
+                    for tag in tags:
+                        pipe.sadd(self._tag_key(tag), key)
+                        pipe.expire(self._tag_key(tag), TAG_TTL)
+                    await pipe.execute()
+            except RedisError as e:
+                self.stats['errors'] += 1
+                logger.warning(f'Write query cache failed: {e}')
+        return raw
+
+
+query_cache = QueryCache(l1_size=settings.QUERY_CACHE_L1_SIZE, l1_ttl=settings.QUERY_CACHE_L1_TTL)
+
+# 会话 flush 和执行 DML 时记录写入的表，提交后失效对应缓存，回滚则丢弃
+_INFO_KEY = 'query_cache_tags'
+_pending_invalidations = set()
+# text() 执行的写入语句，只识别第一张表
+_TEXT_WRITE_TABLE = re.compile(
+    r'\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE(?:\s+IGNORE)?|DELETE\s+FROM)\s+[`"]?(\w+)', re.IGNORECASE
+)
+
+
+def _has_pending_writes(session: Session) -> bool:
+    """会话中是否有未提交的写入，包括未 flush 的对象、已执行的 DML 和 sql.py 记录的其他写入语句"""
+    return bool(
+        session.new
+        or session.dirty
+        or session.deleted
+        or session.info.get(_INFO_KEY)
+        or session.info.get('pending_write')
+    )
+
+
+def _get_written_tables(objects: Iterable) -> set:
+    return {table.name for obj in objects for table in inspect(obj).mapper.tables}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session: Session, _flush_context):
+    tables = _get_written_tables([*session.new, *session.dirty, *session.deleted])
+    if tables:
+        session.info.setdefault(_INFO_KEY, set()).update(tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_executed_tables(state: ORMExecuteState):
+    # Core 的 insert/update/delete（包括 bulk_insert、bulk_upsert）不经过 flush，在执行时记录
+    if state.is_insert or state.is_update or state.is_delete:
+        table = state.statement.table
+        tables = {table.name} if isinstance(table, Table) else set()
+    elif isinstance(state.statement, TextClause):
+        match = _TEXT_WRITE_TABLE.match(state.statement.text)
+        tables = {match.group(1)} if match else set()
+    else:
+        return
+    if tables:
+        state.session.info.setdefault(_INFO_KEY, set()).update(tables)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_tables(session: Session):
+    tables = session.info.pop(_INFO_KEY, None)
+    if not tables:
+        return
+    # 先在提交时同步失效本地缓存，进行中的加载不会再写入旧数据
+    query_cache.invalidate_local(tables)
+    try:
+        task = asyncio.get_running_loop().create_task(query_cache.invalidate_remote(tables))
+    except RuntimeError:
+        # 同步会话中没有运行的事件循环，只能失效本地缓存
+        return
+    # 保留任务的引用，避免执行完之前被回收
+    _pending_invalidations.add(task)
+    task.add_done_callback(_on_invalidation_done)
+
+
+def _on_invalidation_done(task: asyncio.Task):
+    _pending_invalidations.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f'Invalidate query cache failed: {task.exception()!r}')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session: Session):
+    session.info.pop(_INFO_KEY, None)
+
+
+__all__ = ['QueryCache', 'query_cache']
@@ -0,0 +1,75 @@
+import functools
+import re
+
+from config import settings
+from utils.context import request_stats_var
+from utils.logger import sql_logger
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+# 展开后的 IN 列表，长度不同的列表视为同一形态
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)')
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    """归一化 SQL：合并空白，字面量和 IN 列表替换为占位符，参数不同的同一语句得到相同的形态"""
+    sql = _WHITESPACE.sub(' ', statement).strip()
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _IN_LIST.sub('(?...)', sql)
+
+
+def _get_param_shape(parameters, executemany: bool) -> str:
+    """参数的类型结构，不输出参数值，避免日志中出现敏感数据"""
+    if executemany:
+        return f'{len(parameters)} x {_get_param_shape(parameters[0], False)}' if parameters else '[]'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters or ()) + ')'
+
+
+def _explain(conn, statement: str, parameters):
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    # 使用新的 DBAPI 游标执行，不触发引擎事件，也不影响原语句的结果
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def check_statement(conn, statement: str, parameters, context, executemany: bool, elapsed: float):
+    """
+    在语句执行后调用：超过 SQL_SLOW_THRESHOLD 的语句记录慢查询日志，开发环境可附带 EXPLAIN 结果
+    （流式查询除外）；
+    同一请求内相同形态的语句执行次数达到 SQL_N_PLUS_ONE_THRESHOLD 时记录一次 N+1 警告
+    """
+    stats = request_stats_var.get()
+    if elapsed < settings.SQL_SLOW_THRESHOLD and stats is None:
+        return
+    sql = normalize_sql(statement)
+    if stats is not None:
+        count = stats.db_statements[sql] = stats.db_statements.get(sql, 0) + 1
+        if count == settings.SQL_N_PLUS_ONE_THRESHOLD:
+            sql_logger.warning(f'Possible N+1 query, executed {count} times in one request: {sql}', extra=dict(sql=sql))
+    if elapsed < settings.SQL_SLOW_THRESHOLD:
+        return
+    params = _get_param_shape(parameters, executemany)
+    message = f'Slow query {elapsed * 1000:.1f}ms: {sql} params={params}'
+    # 流式查询（服务端游标）的结果尚未读取，在同一连接上执行 EXPLAIN 会先丢弃未读取的结果
+    streaming = context is not None and context.execution_options.get('stream_results')
+    if (
+        settings.IS_DEV
+        and settings.SQL_EXPLAIN_SLOW
+        and not executemany
+        and not streaming
+        and sql.upper().startswith('SELECT')
+    ):
+        try:
+            message += f'\nEXPLAIN: {_explain(conn, statement, parameters)}'
+        except Exception as e:
+            message += f'\nEXPLAIN failed: {e}'
+    sql_logger.warning(message, extra=dict(sql=sql, params=params, duration_ms=round(elapsed * 1000, 3)))
@@ -1,29 +1,212 @@
 import asyncio
 import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Tuple
 
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
 from config import settings
+from utils.context import record_redis_time
+from utils.metrics import observe_redis_command
 
 __redis_client: redis.Redis = None
+__redis_batcher: Optional['BatchingRedis'] = None
+__redis_lock: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = None
+_redis_stats = dict(created=0, connect_errors=0, batch_flushes=0, batched_commands=0)
+__redis_retry_at = 0.0
+
+
+def _make_backoff() -> ExponentialBackoff:
+    return ExponentialBackoff(cap=settings.REDIS_RETRY_BACKOFF_CAP, base=settings.REDIS_RETRY_BACKOFF_BASE)
+
+
+class TimedConnection(redis.Connection):
+    """记录命令耗时的连接，计入当前请求的 redis 耗时，pipeline 中的每个响应只计从上一个响应到达起的时间"""
+
+    _sent_at = 0.0
+
+    async def send_packed_command(self, command, check_health: bool = True):
+        self._sent_at = time.perf_counter()
+        await super().send_packed_command(command, check_health)
+
+    async def read_response(self, *args, **kwargs):
+        response = await super().read_response(*args, **kwargs)
+        now = time.perf_counter()
+        record_redis_time(now - self._sent_at)
+        if settings.METRICS_ENABLED:
+            observe_redis_command(now - self._sent_at)
+        self._sent_at = now
+        return response
+
+
+def _create_redis_client() -> redis.Redis:
+    # 连接池满时等待空闲连接，而不是直接抛出 Too many connections
+    # 使用 unix socket 或 rediss 时 url 中的连接类型优先
+    pool = redis.BlockingConnectionPool.from_url(
+        settings.REDIS_URI,
+        connection_class=TimedConnection,
+        decode_responses=True,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(_make_backoff(), settings.REDIS_RETRY_ATTEMPTS),
+    )
+    return redis.Redis.from_pool(pool)
+
+
+def _get_redis_lock() -> asyncio.Lock:
+    # asyncio.Lock 绑定首次等待时的事件循环，每个事件循环（测试、脚本中的 asyncio.run）使用各自的锁
+    global __redis_lock
+    loop = asyncio.get_running_loop()
+    if __redis_lock is None or __redis_lock[0] is not loop:
+        __redis_lock = (loop, asyncio.Lock())
+    return __redis_lock[1]
 
 
 async def get_async_redis_connection() -> redis.Redis:
-    global __redis_client
-    try:
-        if not __redis_client:
-            __redis_client = await redis.from_url(settings.REDIS_URI, decode_responses=True)
+    global __redis_client, __redis_retry_at
+    if __redis_client:
         return __redis_client
-    except redis.ConnectionError as e:
-        logging.warning(f'Redis connect error, Retrying... \n{e}')
-        await asyncio.sleep(3)
-        return await get_async_redis_connection()
+    async with _get_redis_lock():  # 防止并发的首次请求创建多个客户端
+        if __redis_client:
+            return __redis_client
+        if time.monotonic() < __redis_retry_at:
+            # 连接失败后的冷却期内直接失败，避免每个请求都等待重试
+            raise redis.ConnectionError('Redis unavailable, retry later')
+        client = _create_redis_client()
+        try:
+            # ping 失败时按 Retry 的指数退避重试，超过次数后抛出异常
+            await client.ping()
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            _redis_stats['connect_errors'] += 1
+            await client.aclose()
+            logging.warning(f'Redis connect error \n{e}')
+            __redis_retry_at = time.monotonic() + settings.REDIS_RETRY_BACKOFF_CAP
+            raise
+        __redis_client = client
+        _redis_stats['created'] += 1
+        return __redis_client
+
+
+_explicit_batch: ContextVar[Optional[Tuple['BatchingRedis', list]]] = ContextVar('redis_explicit_batch', default=None)
+
+
+class BatchingRedis(redis.Redis):
+    """
+    自动合并命令的 redis 客户端
+    同一事件循环周期内发出的命令（如 asyncio.gather 中的多个 get/hget/expire）合并为一个 pipeline 发送，
+    结果再分发给各自的调用方，命令方法与 redis.Redis 一致，调用处无需修改
+    """
+
+    # 阻塞命令和连接状态相关的命令不能放入 pipeline
+    NON_BATCHABLE = frozenset(
+        ['BLPOP', 'BRPOP', 'BLMOVE', 'BRPOPLPUSH', 'BZPOPMIN', 'BZPOPMAX', 'BLMPOP', 'BZMPOP', 'WATCH', 'MULTI']
+        + ['EXEC', 'DISCARD', 'SUBSCRIBE', 'PSUBSCRIBE', 'MONITOR', 'SELECT', 'CLIENT', 'AUTH', 'HELLO', 'QUIT']
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending: List[tuple] = []
+        self._flush_scheduled = False
+        self._flush_tasks = set()
+
+    def execute_command(self, *args, **options):
+        if str(args[0]).upper() in self.NON_BATCHABLE:
+            return super().execute_command(*args, **options)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        explicit = _explicit_batch.get()
+        if explicit is not None and explicit[0] is self:
+            explicit[1].append((args, options, future))
+            return future
+        self._pending.append((args, options, future))
+        if not self._flush_scheduled:
+            # 在当前周期已就绪的回调之后再发送，收集同一周期内其他协程发出的命令
+            self._flush_scheduled = True
+            loop.call_soon(self._flush_pending)
+        return future
+
+    @contextmanager
+    def batch(self):
+        """
+        显式合并上下文内发出的命令，退出时一次发送
+        上下文内只能收集命令返回的 future，不能 await，否则会一直等待
+        """
+        commands = []
+        token = _explicit_batch.set((self, commands))
+        try:
+            yield self
+        finally:
+            _explicit_batch.reset(token)
+            self._start_flush(commands)
+
+    def _flush_pending(self):
+        self._flush_scheduled = False
+        commands, self._pending = self._pending, []
+        self._start_flush(commands)
+
+    def _start_flush(self, commands: List[tuple]):
+        if not commands:
+            return
+        task = asyncio.ensure_future(self._flush(commands))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, commands: List[tuple]):
+        _redis_stats['batch_flushes'] += 1
+        _redis_stats['batched_commands'] += len(commands)
+        try:
+            async with self.pipeline(transaction=False) as pipe:
+                for args, options, _ in commands:
+                    pipe.execute_command(*args, **options)
+                results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            results = [e] * len(commands)
+        for (_, _, future), result in zip(commands, results):
+            if future.done():  # 调用方已取消
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def get_async_redis_batcher() -> BatchingRedis:
+    """获取自动合并命令的 redis 客户端，与 get_async_redis_connection 共用连接池"""
+    global __redis_batcher
+    client = await get_async_redis_connection()
+    if __redis_batcher is None or __redis_batcher.connection_pool is not client.connection_pool:
+        __redis_batcher = BatchingRedis(connection_pool=client.connection_pool)
+    return __redis_batcher
+
+
+def get_redis_pool_stats() -> dict:
+    """redis 连接池统计，用于监控"""
+    stats = dict(_redis_stats, max_connections=settings.REDIS_MAX_CONNECTIONS, in_use=0, idle=0)
+    if __redis_client:
+        pool = __redis_client.connection_pool
+        stats['in_use'] = len(getattr(pool, '_in_use_connections', ()))
+        stats['idle'] = len(getattr(pool, '_available_connections', ()))
+    return stats
 
 
 async def close_redis_connect():
-    global __redis_client
+    global __redis_client, __redis_batcher
+    __redis_batcher = None
     if __redis_client:
-        await __redis_client.close()
+        await __redis_client.aclose()
         __redis_client = None
 
 
-__all__ = ['get_async_redis_connection', 'close_redis_connect']
+__all__ = [
+    'get_async_redis_connection',
+    'get_async_redis_batcher',
+    'get_redis_pool_stats',
+    'close_redis_connect',
+    'BatchingRedis',
+]
@@ -1,21 +1,189 @@
 import asyncio
+import itertools
 import os
-from typing import AsyncGenerator, TypeVar
+import re
+import time
+from contextvars import ContextVar
+from typing import AsyncGenerator, TypeVar, Optional
 from contextlib import asynccontextmanager
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base
-from sqlalchemy import select, MetaData
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy import select, MetaData, exc, Select, CompoundSelect, event, Engine
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings
+from utils.context import record_db_time, request_stats_var
+from utils.logger import sql_logger
+from utils.metrics import observe_db_checkout, observe_db_query
+from .monitor import check_statement
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """记录连接签出等待时间的连接池"""
+
+    slow_checkout = 0.1
+    stats = dict(checkouts=0, timeouts=0, wait_total=0.0, wait_max=0.0)
+
+    def connect(self):
+        start = time.perf_counter()
+        timeout = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats['timeouts'] += 1
+            timeout = True
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            if settings.METRICS_ENABLED:
+                observe_db_checkout(wait, timeout)
+            self.stats['checkouts'] += 1
+            self.stats['wait_total'] += wait
+            self.stats['wait_max'] = max(self.stats['wait_max'], wait)
+            if wait > self.slow_checkout:
+                sql_logger.warning(f'Slow db pool checkout: {wait:.3f}s, {self.status()}')
+
+
+def _get_pool_size():
+    """计算连接池大小，开启自动计算时按 worker 数平分 mysql 的连接数预算"""
+    if not settings.MYSQL_POOL_AUTO_SIZE:
+        return settings.MYSQL_POOL_SIZE, settings.MYSQL_MAX_OVERFLOW
+    budget = settings.MYSQL_MAX_CONNECTIONS - settings.MYSQL_RESERVED_CONNECTIONS
+    workers = max(1, settings.WEB_WORKERS)
+    per_worker = budget // workers
+    if per_worker < 1:
+        # 每个 worker 至少需要一个连接，预算不足时连接总数会超出预算
+        sql_logger.warning(
+            f'MySQL connection budget {budget} is less than WEB_WORKERS {workers}, '
+            f'total connections may reach {workers} and exceed MYSQL_MAX_CONNECTIONS'
+        )
+        per_worker = 1
+    # 三分之二常驻，其余作为溢出连接，保证所有 worker 的连接总数不超过预算
+    pool_size = max(1, per_worker * 2 // 3)
+    return pool_size, per_worker - pool_size
+
+
+def _get_pool_options() -> dict:
+    if not hasattr(settings, 'MYSQL_POOL_SIZE'):
+        # 测试环境使用 sqlite，保留默认连接池
+        return dict(pool_recycle=3600, pool_pre_ping=True)
+    pool_size, max_overflow = _get_pool_size()
+    TimedQueuePool.slow_checkout = settings.MYSQL_POOL_SLOW_CHECKOUT
+    return dict(
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.MYSQL_POOL_TIMEOUT,
+        pool_recycle=settings.MYSQL_POOL_RECYCLE,  # 定期回收连接
+        pool_use_lifo=settings.MYSQL_POOL_USE_LIFO,  # 优先复用最近的连接，空闲连接可以被回收
+        pool_pre_ping=settings.MYSQL_POOL_PRE_PING,  # 启用连接检查
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 语句在 greenlet 中执行，仍能读取到请求的上下文变量
+    elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+    record_db_time(elapsed)
+    if settings.METRICS_ENABLED:
+        observe_db_query(statement, elapsed)
+    check_statement(conn, statement, parameters, context, executemany, elapsed)
+
+
+def _create_engine(uri: str) -> AsyncEngine:
+    engine = create_async_engine(
+        uri,
+        echo=settings.IS_PRINT_SQL,  # 是否打印SQL语句
+        **_get_pool_options(),
+    )
+    # 记录语句耗时，计入当前请求的数据库耗时，并检查慢查询和 N+1 查询
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    return engine
+
+
+async_engine = _create_engine(settings.SQLALCHEMY_DATABASE_URI)
+# 只读从库，未配置时所有查询都走主库
+replica_engines = [_create_engine(uri) for uri in getattr(settings, 'SQLALCHEMY_REPLICA_URIS', [])]
+_replica_cycle = itertools.cycle(replica_engines)
+# 同一请求内的会话共享写入时间，用于写后读走主库，由最外层的会话设置并在其结束时重置
+_request_state: ContextVar[Optional[dict]] = ContextVar('db_request_state', default=None)
+
+
+def _pick_replica() -> AsyncEngine:
+    if settings.MYSQL_REPLICA_STRATEGY == 'least_connections':
+        return min(replica_engines, key=lambda engine: engine.pool.checkedout())
+    return next(_replica_cycle)
+
+
+class RoutingSession(Session):
+    """
+    读写分离会话
+    写入（flush、insert/update/delete）和加锁查询走主库，其余 SELECT 走从库，
+    会话写入后的查询以及同一请求内写入后 MYSQL_READ_YOUR_WRITES_WINDOW 秒内的查询也走主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        # 主库沿用会话或 sessionmaker 指定的 bind
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = self.info['pending_write'] = True
+            self.info.get('request_state', {})['last_write'] = time.monotonic()
+            return super().get_bind(mapper, clause=clause, **kw)
+        if not self.info.get('use_replica') or not replica_engines or not self._is_replica_read(clause):
+            return super().get_bind(mapper, clause=clause, **kw)
+        # 同一会话固定使用一个从库，保证会话内读到的数据一致
+        replica = self.info.get('replica')
+        if replica is None:
+            replica = self.info['replica'] = _pick_replica()
+        return replica.sync_engine
+
+    def _is_replica_read(self, clause) -> bool:
+        if not isinstance(clause, (Select, CompoundSelect)) or self.info.get('wrote'):
+            return False
+        if isinstance(clause, Select) and clause._for_update_arg is not None:
+            return False
+        last_write = self.info.get('request_state', {}).get('last_write')
+        return last_write is None or time.monotonic() - last_write > settings.MYSQL_READ_YOUR_WRITES_WINDOW
+
+
+# 只读语句，其余语句（包括 text() 和 exec_driver_sql 执行的语句）都视为写入
+_READ_STATEMENT = re.compile(r'\s*(SELECT|SHOW|EXPLAIN|DESCRIBE|DESC|PRAGMA)\b', re.IGNORECASE)
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def _attach_session_info(session, transaction, connection):
+    # 通过执行选项把会话信息带到引擎事件中，用于记录实际执行的写入
+    connection.execution_options(session_info=session.info)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _mark_session_write(conn, cursor, statement, parameters, context, executemany):
+    session_info = conn.get_execution_options().get('session_info')
+    if session_info is None or _READ_STATEMENT.match(statement):
+        return
+    session_info['wrote'] = session_info['pending_write'] = True
+    session_info.get('request_state', {})['last_write'] = time.monotonic()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def _clear_pending_write(session):
+    # 事务结束后不再有未提交的写入，wrote 仍保留，会话之后的查询继续走主库
+    session.info.pop('pending_write', None)
+
 
-async_engine = create_async_engine(
-    settings.SQLALCHEMY_DATABASE_URI,
-    pool_recycle=3600,  # 每小时回收连接
-    pool_pre_ping=True,  # 启用连接检查
-    echo=settings.IS_PRINT_SQL,  # 是否打印SQL语句
-)
 # 创建 AsyncSessionLocal 类，用于数据库会话管理
-AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=async_engine, class_=AsyncSession)
+AsyncSessionLocal = async_sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+)
 
 metadata = MetaData()
 
@@ -23,14 +191,68 @@ TableBase = declarative_base(metadata=metadata)
 T_TableBase = TypeVar('T_TableBase', bound=TableBase)
 
 
+def _get_engine_pool_stats(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return dict(status=pool.status())
+    return dict(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+
+
+def get_db_pool_stats() -> dict:
+    """数据库连接池统计，用于监控和调优"""
+    stats = _get_engine_pool_stats(async_engine)
+    if isinstance(async_engine.pool, TimedQueuePool):
+        # 签出统计为所有引擎的汇总
+        stats.update(TimedQueuePool.stats)
+    if replica_engines:
+        stats['replicas'] = [_get_engine_pool_stats(engine) for engine in replica_engines]
+    return stats
+
+
+async def release_db(db: AsyncSession):
+    """
+    提前结束会话的事务并将连接归还连接池，有写入时提交，否则直接关闭会话
+    写入包括 ORM 变更和执行过的非只读语句（Core DML、text()、exec_driver_sql），
+    lazy 会话提交时不过期对象，关闭时对象与会话分离，两种情况下已加载的属性都可以继续读取和序列化，
+    未加载的属性（如延迟加载的关系）不能再访问；会话仍可执行新的查询，会重新签出连接
+    """
+    if not db.in_transaction():
+        return
+    if db.new or db.dirty or db.deleted or db.sync_session.info.pop('pending_write', False):
+        await db.commit()
+    else:
+        # 回滚会过期所有对象，只读事务直接关闭，对象保留已加载的状态
+        await db.close()
+
+
 @asynccontextmanager
-async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
-    async_db: AsyncSession = AsyncSessionLocal()
+async def get_async_db(use_replica: bool = False, lazy: bool = False) -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取数据库会话，use_replica 为 True 时只读查询会路由到从库
+    lazy 为 True 时不预先开启事务，第一次执行语句时才签出连接，结束时只在有写入时提交，
+    处理函数可以在最后一次查询后调用 release_db 提前归还连接
+    """
+    request_state = _request_state.get()
+    token = None
+    if request_state is None:
+        # 请求内先后打开的会话共享请求级别的状态，请求之外只有嵌套的会话共享
+        stats = request_stats_var.get()
+        request_state = stats.db_state if stats is not None else {}
+        token = _request_state.set(request_state)
+    info = dict(use_replica=use_replica, request_state=request_state)
+    # lazy 会话可能在序列化前提前提交，提交后不过期对象，避免访问属性时在事务外重新加载
+    async_db: AsyncSession = AsyncSessionLocal(info=info, expire_on_commit=not lazy)
     try:
-        async with async_db.begin():  # 自动管理事务
+        if lazy:
             yield async_db
+            await release_db(async_db)
+        else:
+            async with async_db.begin():  # 自动管理事务
+                yield async_db
     finally:
         await async_db.close()
+        if token is not None:
+            _request_state.reset(token)
 
 
 @asynccontextmanager
@@ -58,8 +280,12 @@ async def get_test_async_db():
 
 __all__ = [
     'get_async_db',
+    'release_db',
     'get_test_async_db',
     'async_engine',
+    'replica_engines',
+    'RoutingSession',
+    'get_db_pool_stats',
     'TableBase',
     'T_TableBase',
     'AsyncSessionLocal',
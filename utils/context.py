@@ -0,0 +1,37 @@
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+
+class RequestStats:
+    """单个请求内数据库和 redis 的耗时（秒）与次数，由访问日志中间件创建"""
+
+    __slots__ = ('db_time', 'db_count', 'db_statements', 'db_state', 'redis_time', 'redis_count')
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_count = 0
+        self.db_statements: Dict[str, int] = {}  # 归一化的语句 -> 执行次数，用于发现 N+1 查询
+        self.db_state: dict = {}  # 请求内各数据库会话共享的状态，如最近一次写入的时间
+        self.redis_time = 0.0
+        self.redis_count = 0
+
+
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+request_stats_var: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def record_db_time(elapsed: float):
+    stats = request_stats_var.get()
+    if stats is not None:
+        stats.db_time += elapsed
+        stats.db_count += 1
+
+
+def record_redis_time(elapsed: float):
+    stats = request_stats_var.get()
+    if stats is not None:
+        stats.redis_time += elapsed
+        stats.redis_count += 1
+
+
+__all__ = ['RequestStats', 'request_id_var', 'request_stats_var', 'record_db_time', 'record_redis_time']
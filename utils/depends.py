@@ -1,6 +1,30 @@
+from fastapi import Depends
+
 from utils.connect import get_async_db
+from utils.errors import Http401Unauthorized
+from utils.security import OAUTH2_SCHEME, authenticate_token
 
 
 async def get_adb():
     async with get_async_db() as db:
         yield db
+
+
+async def get_lazy_adb():
+    """第一次查询时才签出连接，只有写入时才提交，可配合 release_db 提前归还连接"""
+    async with get_async_db(lazy=True) as db:
+        yield db
+
+
+async def get_read_adb():
+    """读多写少的接口使用，只读查询路由到从库"""
+    async with get_async_db(use_replica=True, lazy=True) as db:
+        yield db
+
+
+async def get_current_user_id(token: str = Depends(OAUTH2_SCHEME)) -> int:
+    """校验访问令牌，返回当前用户 id"""
+    user_id = await authenticate_token(token)
+    if user_id is None:
+        raise Http401Unauthorized('令牌无效或已过期')
+    return user_id
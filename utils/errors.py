@@ -58,7 +58,7 @@ class Http400BadRequest(HTTPException):
 
 class Http401Unauthorized(HTTPException):
     def __init__(self, detail: str = None, headers=None):
-        headers = (headers or {'WWW-Authenticate': 'Bearer'},)
+        headers = headers or {'WWW-Authenticate': 'Bearer'}
         super().__init__(status.HTTP_401_UNAUTHORIZED, detail, headers)
 
 
@@ -87,6 +87,11 @@ class Http501NotImplemented(HTTPException):
         super().__init__(status.HTTP_501_NOT_IMPLEMENTED, detail, headers)
 
 
+class Http503ServiceUnavailable(HTTPException):
+    def __init__(self, detail: str = None, headers=None):
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, detail, headers)
+
+
 HTTP_ERROR_CLASS_RE = re.compile(r'Http(?P<code>\d+)(\w+)')
 
 
@@ -1,18 +1,71 @@
+import atexit
+import copy
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+from datetime import datetime
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from typing import Dict, List
+
+import orjson
 
 from config import settings
+from utils.context import request_id_var
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的字段
+_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON，通过 extra 传入的字段作为顶层字段输出，便于日志系统检索"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = dict(
+            time=datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            level=record.levelname,
+            logger=record.name,
+            request_id=getattr(record, 'request_id', '-'),
+            process=record.process,
+            location=f'{record.module}:{record.funcName}:{record.lineno}',
+            message=record.getMessage(),
+        )
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != 'request_id':
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return orjson.dumps(data, default=str).decode()
+
+
+class RequestIdFilter(logging.Filter):
+    """为记录附加当前请求的 ID，经队列写出时在调用方的上下文中附加，监听线程中不再覆盖"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        return True
 
 
 logger = logging.getLogger(settings.PROJECT_NAME)
 logger.setLevel(logging.INFO if settings.IS_PROD else logging.DEBUG)
-formatter = logging.Formatter(
-    fmt='%(asctime)s.%(msecs)03d %(levelname)-7s [%(process)d] %(module)s:%(funcName)s:%(lineno)d - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-)
+# 每个请求一条访问日志，包含路由、状态码和各部分耗时
+access_logger = logging.getLogger(f'{settings.PROJECT_NAME}.access')
+# 慢查询和 N+1 查询日志
+sql_logger = logging.getLogger(f'{settings.PROJECT_NAME}.sql')
+if settings.LOG_FORMAT == 'json':
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        fmt='%(asctime)s.%(msecs)03d %(levelname)-7s [%(process)d] [%(request_id)s] '
+        '%(module)s:%(funcName)s:%(lineno)d - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+    )
+request_id_filter = RequestIdFilter()
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+handlers: List[logging.Handler] = [console_handler]
 
 if settings.IS_PROD:
     # 文件输出（自动轮转）
@@ -28,6 +81,93 @@ if settings.IS_PROD:
         encoding='utf-8',
     )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers.append(file_handler)
+
+for handler in handlers:
+    handler.addFilter(request_id_filter)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    写入有界队列的日志处理器，队列满时不阻塞调用方
+    drop_oldest 为 True 时丢弃队列中最旧的记录，否则丢弃新记录，dropped 记录丢弃数量
+    """
+
+    def __init__(self, queue_: queue.Queue, drop_oldest: bool = False):
+        super().__init__(queue_)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能在之后被修改，只在调用方合并消息，时间和异常堆栈的格式化交给监听线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            self.dropped += 1
+        if not self.drop_oldest:
+            return
+        try:
+            self.queue.get_nowait()
+            self.queue.put_nowait(record)
+        except (queue.Empty, queue.Full):
+            pass
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 队列可能已满，阻塞等待监听线程腾出位置，保证停止前的记录都被写出
+        self.queue.put(self._sentinel)
+
+
+queue_handler = None
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    queue_handler.queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    _listener = _QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_log_listener():
+    """停止监听线程并写出队列中剩余的日志，之后的日志直接同步写出，worker 退出时调用"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    logger.removeHandler(queue_handler)
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+if settings.LOG_QUEUE_ENABLED:
+    # 调用方只把记录放入队列，格式化和 I/O 在后台线程中完成，慢磁盘和日志轮转不会阻塞事件循环
+    queue_handler = DroppingQueueHandler(queue.Queue(), drop_oldest=settings.LOG_QUEUE_DROP_OLDEST)
+    queue_handler.addFilter(request_id_filter)
+    logger.addHandler(queue_handler)
+    _start_listener()
+    atexit.register(stop_log_listener)
+    # 线程不会被 fork 继承，预加载应用时在子进程中重新启动监听线程
+    os.register_at_fork(after_in_child=lambda: _listener is not None and _start_listener())
+else:
+    for handler in handlers:
+        logger.addHandler(handler)
+
+
+def get_log_stats() -> Dict[str, int]:
+    """日志队列统计，用于监控"""
+    if queue_handler is None:
+        return dict(queued=0, dropped=0, max_size=0)
+    return dict(queued=queue_handler.queue.qsize(), dropped=queue_handler.dropped, max_size=settings.LOG_QUEUE_SIZE)
+
 
-__all__ = ['logger']
+__all__ = ['logger', 'access_logger', 'sql_logger', 'get_log_stats', 'stop_log_listener']
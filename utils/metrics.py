@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from utils.access_log import get_route_template
+from utils.logger import logger
+
+# gunicorn 启动时设置该环境变量，各 worker 将指标写入目录下的文件，采集时汇总所有 worker 的指标
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+# 数据库和 redis 的耗时远小于请求，使用更细的分桶
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'route'])
+REQUEST_COUNT = Counter('http_requests_total', 'HTTP requests', ['method', 'route', 'status'])
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests in progress', ['method'], multiprocess_mode='livesum'
+)
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'SQL statement latency', ['operation'], buckets=FAST_BUCKETS)
+DB_POOL_CHECKOUT_WAIT = Histogram('db_pool_checkout_wait_seconds', 'DB pool checkout wait', buckets=FAST_BUCKETS)
+DB_POOL_TIMEOUTS = Counter('db_pool_checkout_timeouts_total', 'DB pool checkout timeouts')
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'DB pool connections', ['state'], multiprocess_mode='livesum')
+REDIS_LATENCY = Histogram('redis_command_duration_seconds', 'Redis command latency', buckets=FAST_BUCKETS)
+SNOWFLAKE_IDS = Counter('snowflake_ids_generated_total', 'Snowflake ids generated')
+EVENT_LOOP_LAG = Gauge('event_loop_lag_seconds', 'Event loop lag', multiprocess_mode='livemax')
+
+# 语句类型固定，预先取得各标签的子指标，避免每条语句都查找标签
+_SQL_OPERATIONS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+_db_query_latency = {operation: DB_QUERY_LATENCY.labels(operation) for operation in _SQL_OPERATIONS + ('OTHER',)}
+
+__collector_task: Optional[asyncio.Task] = None
+__snowflake_generated = 0
+
+
+class MetricsMiddleware:
+    """按路由模板记录请求耗时和请求数，以及处理中的请求数"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            route = _get_route_label(scope)
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            REQUEST_COUNT.labels(method, route, str(status_code)).inc()
+
+
+def _get_route_label(scope: Scope) -> str:
+    # 未匹配到接口的请求（404、静态文件）不使用原始路径，避免标签数量无限增长
+    route = scope.get('route')
+    if route is None or isinstance(route, Mount):
+        return '<unmatched>'
+    return get_route_template(scope)
+
+
+def observe_db_query(statement: str, elapsed: float):
+    operation = statement.lstrip()[:6].upper()
+    _db_query_latency.get(operation, _db_query_latency['OTHER']).observe(elapsed)
+
+
+def observe_db_checkout(wait: float, timeout: bool = False):
+    DB_POOL_CHECKOUT_WAIT.observe(wait)
+    if timeout:
+        DB_POOL_TIMEOUTS.inc()
+
+
+def observe_redis_command(elapsed: float):
+    REDIS_LATENCY.observe(elapsed)
+
+
+def _collect_runtime_metrics():
+    """连接池状态和雪花 ID 数量在后台定期同步，不在热点路径上更新指标"""
+    global __snowflake_generated
+    from sqlalchemy.pool import QueuePool
+    from utils.connect import async_engine
+    from utils.snowflake import generator
+
+    pool = async_engine.pool
+    if isinstance(pool, QueuePool):
+        DB_POOL_CONNECTIONS.labels('size').set(pool.size())
+        DB_POOL_CONNECTIONS.labels('checked_out').set(pool.checkedout())
+        DB_POOL_CONNECTIONS.labels('overflow').set(max(pool.overflow(), 0))
+    generated = generator.generated
+    SNOWFLAKE_IDS.inc(generated - __snowflake_generated)
+    __snowflake_generated = generated
+
+
+async def _collect_forever(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        # 实际休眠时间超出预期的部分即事件循环被阻塞的时间
+        EVENT_LOOP_LAG.set(max(loop.time() - start - interval, 0.0))
+        try:
+            _collect_runtime_metrics()
+        except Exception as e:
+            logger.warning(f'Collect runtime metrics failed: {e}')
+
+
+def start_metrics_collector():
+    """启动后台采集任务，worker 启动时调用"""
+    global __collector_task
+    if settings.METRICS_ENABLED and __collector_task is None:
+        __collector_task = asyncio.create_task(_collect_forever(settings.METRICS_COLLECT_INTERVAL))
+
+
+def stop_metrics_collector():
+    global __collector_task
+    if __collector_task is not None:
+        __collector_task.cancel()
+        __collector_task = None
+
+
+def generate_metrics() -> bytes:
+    """导出 Prometheus 文本格式的指标，多进程模式下需要读取所有 worker 的指标文件"""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+__all__ = [
+    'CONTENT_TYPE_LATEST',
+    'MetricsMiddleware',
+    'observe_db_query',
+    'observe_db_checkout',
+    'observe_redis_command',
+    'start_metrics_collector',
+    'stop_metrics_collector',
+    'generate_metrics',
+]
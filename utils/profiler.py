@@ -0,0 +1,183 @@
+import cProfile
+import hashlib
+import hmac
+import os
+import pstats
+import random
+import time
+from typing import Dict, Iterable, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+from utils.context import request_id_var, request_stats_var
+from utils.logger import logger
+
+try:
+    # 采样分析器，异步模式下只统计当前请求的协程，等待时间计入发起等待的调用
+    from pyinstrument import Profiler
+    from pyinstrument.frame import AWAIT_FRAME_IDENTIFIER
+except ImportError:
+    Profiler = AWAIT_FRAME_IDENTIFIER = None
+
+PROFILE_TOKEN_HEADER = b'x-profile-token'
+PROFILE_TOKEN_QUERY = 'profile_token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# 按函数名归类的自身耗时，其余计入处理函数
+_SERIALIZATION_NAMES = ('serialize', 'jsonable_encoder', 'render', 'to_json', 'dump_json', 'orjson', 'dumps')
+_VALIDATION_NAMES = ('validate', 'request_params_to_args', 'request_body_to_args')
+
+
+def make_profile_token(ttl: int = 300) -> str:
+    """生成 ttl 秒内有效的分析令牌，通过 X-Profile-Token 请求头或 profile_token 查询参数传入"""
+    expires = str(int(time.time()) + ttl)
+    signature = hmac.new(settings.PROFILING_SECRET.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return f'{expires}.{signature}'
+
+
+def verify_profile_token(token: str) -> bool:
+    expires, _, signature = token.partition('.')
+    if not settings.PROFILING_SECRET or not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(settings.PROFILING_SECRET.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+class ProfilingMiddleware:
+    """
+    按需分析单个请求：携带有效的分析令牌或按 PROFILING_SAMPLE_RATE 抽样的请求开启分析器，
+    报告保存到 PROFILING_DIR（pyinstrument 为 HTML 调用树，cProfile 为 pstats 文件），
+    并记录一条日志，将总耗时拆分为处理函数、参数校验、序列化、SQL 和 redis 几部分。
+    未配置令牌密钥且抽样率为 0 时不添加该中间件；未触发的请求只检查请求头和抽样。
+    未安装 pyinstrument 时使用 cProfile，cProfile 统计整个线程，同时处理的其他请求也会计入报告
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = settings.PROFILING_SAMPLE_RATE,
+        report_dir: str = settings.PROFILING_DIR,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.report_dir = report_dir
+        # cProfile 分析整个线程且同一时间只能开启一个，同一 worker 同时只分析一个请求
+        self._active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or self._active or not self._should_profile(scope):
+            return await self.app(scope, receive, send)
+        self._active = True
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._active = False
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if not settings.PROFILING_SECRET:
+            return False
+        for name, value in scope['headers']:
+            if name == PROFILE_TOKEN_HEADER:
+                return verify_profile_token(value.decode('latin-1'))
+        if PROFILE_TOKEN_QUERY.encode() in scope['query_string']:
+            query = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+            return verify_profile_token(query.get(PROFILE_TOKEN_QUERY, ''))
+        return False
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send):
+        profile_id = f'{time.strftime("%Y%m%d-%H%M%S")}-{request_id_var.get()}'
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, profile_id)
+            await send(message)
+
+        if Profiler is not None:
+            profiler = Profiler(interval=settings.PROFILING_INTERVAL)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if Profiler is not None:
+                profiler.stop()
+            else:
+                profiler.disable()
+            stats = request_stats_var.get()
+            io_times = (stats.db_time, stats.redis_time) if stats is not None else (0.0, 0.0)
+            try:
+                # 生成报告和写文件较慢，放到线程池中执行
+                await run_in_threadpool(self._report, scope, profile_id, profiler, elapsed, io_times)
+            except Exception as e:
+                logger.warning(f'Save profile {profile_id} failed: {e}')
+
+    def _report(self, scope: Scope, profile_id: str, profiler, elapsed: float, io_times: Tuple[float, float]):
+        os.makedirs(self.report_dir, exist_ok=True)
+        if Profiler is not None:
+            path = os.path.join(self.report_dir, f'{profile_id}.html')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            self_times = _iter_pyinstrument_self_times(profiler.last_session.root_frame())
+        else:
+            path = os.path.join(self.report_dir, f'{profile_id}.prof')
+            profiler.dump_stats(path)
+            stats = pstats.Stats(profiler).stats
+            self_times = ((file, function, tt) for (file, _, function), (_, _, tt, _, _) in stats.items())
+        breakdown = get_time_breakdown(elapsed, self_times, *io_times)
+        logger.info(
+            f'Profiled {scope["method"]} {scope["path"]} {elapsed * 1000:.1f}ms: '
+            + ' '.join(f'{name}={value:.1f}ms' for name, value in breakdown.items())
+            + f' report={path}',
+            extra=dict(profile=breakdown, report=path),
+        )
+
+
+def _iter_pyinstrument_self_times(frame) -> Iterable[Tuple[str, str, float]]:
+    if frame is None:
+        return
+    stack = [frame]
+    while stack:
+        frame = stack.pop()
+        stack.extend(frame.children)
+        if frame.is_synthetic:
+            continue
+        # 不计等待时间，SQL 和 redis 的等待时间另外统计
+        await_time = sum(child.time for child in frame.children if child.identifier == AWAIT_FRAME_IDENTIFIER)
+        yield frame.file_path or '', frame.function or '', frame.total_self_time - await_time
+
+
+def get_time_breakdown(
+    elapsed: float, self_times: Iterable[Tuple[str, str, float]], db_time: float = 0.0, redis_time: float = 0.0
+) -> Dict[str, float]:
+    """
+    拆分请求耗时（毫秒）：SQL 和 redis 为请求内记录的实际耗时，参数校验和序列化按函数名归类分析器统计的自身耗时，
+    剩余部分计入处理函数
+    """
+    validation = serialization = 0.0
+    for file_path, function, self_time in self_times:
+        name = function.lower()
+        if any(keyword in name for keyword in _SERIALIZATION_NAMES):
+            serialization += self_time
+        elif 'pydantic' in file_path or any(keyword in name for keyword in _VALIDATION_NAMES):
+            validation += self_time
+    handler = max(elapsed - validation - serialization - db_time - redis_time, 0.0)
+    return dict(
+        handler=handler * 1000,
+        validation=validation * 1000,
+        serialization=serialization * 1000,
+        sql=db_time * 1000,
+        redis=redis_time * 1000,
+    )
+
+
+__all__ = ['ProfilingMiddleware', 'make_profile_token', 'verify_profile_token', 'get_time_breakdown']
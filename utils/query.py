@@ -1,11 +1,32 @@
-from typing import Optional, Type, List, Union
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional, Type, List, Union, Tuple, Any, AsyncGenerator, Iterable, Sequence
 
-from sqlalchemy import select, func, Select, Row
+from redis import RedisError
+from sqlalchemy import select, func, insert, Select, Row, Table, Integer, and_, or_, tuple_
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import ColumnElement, UnaryExpression, Label
 
 from config import settings
-from schemas.common import T_BaseModel, PageParams, PaginateResult
-from utils.connect import T_TableBase
+from schemas.common import T_BaseModel, PageParams, PaginateResult, CursorParams, CursorResult, ECountStrategy
+from utils.connect import T_TableBase, AsyncSessionLocal, async_engine, get_async_redis_connection
+from utils.errors import Http400BadRequest
+from utils.logger import logger
+from utils.snowflake import get_next_ids
+
+CURSOR_NEXT = 'n'
+CURSOR_PREV = 'p'
+COUNT_CACHE_PREFIX = 'paginate:count:'
 
 
 async def get_one(db: AsyncSession, entity: Type[T_TableBase], **filter_by) -> Optional[T_TableBase]:
@@ -24,23 +45,53 @@ async def get_parsed_one(
     db: AsyncSession,
     query: Select,
     schema: Type[T_BaseModel] = None,
+    skip_validation: bool = False,
 ) -> Union[T_BaseModel, dict]:
     """通用查询一条记录"""
     result = await db.execute(query)
     val = result.one_or_none()
     if not val:
         return None
-    return parse_row(val, query=query, schema=schema)
+    return parse_row(val, query=query, schema=schema, skip_validation=skip_validation)
 
 
 async def get_parsed_many(
     db: AsyncSession,
     query: Select,
     schema: Type[T_BaseModel] = None,
+    skip_validation: bool = False,
 ) -> List[Union[T_BaseModel, dict]]:
-    """通用查询多条记录"""
+    """
+    通用查询多条记录
+    skip_validation 为 True 时使用 model_construct 构造 schema，跳过 pydantic 校验，仅用于可信的数据
+    """
     result = await db.execute(query)
-    return [parse_row(row, query=query, schema=schema) for row in result.all()]
+    rows = result.all()
+    if not rows:
+        return []
+    parser = get_row_parser(rows[0], query=query, schema=schema, skip_validation=skip_validation)
+    return list(map(parser, rows))
+
+
+async def stream_parsed_many(
+    db: AsyncSession,
+    query: Select,
+    schema: Type[T_BaseModel] = None,
+    yield_per: int = 1000,
+    skip_validation: bool = False,
+) -> AsyncGenerator[List[Union[T_BaseModel, dict]], None]:
+    """
+    流式查询多条记录，用于大批量导出
+    使用服务端游标（aiomysql SSCursor）每次读取 yield_per 行，解析后按批次产出，内存占用只与批次大小有关
+    """
+    result = await db.stream(query, execution_options={'yield_per': yield_per})
+    parser = None
+    try:
+        async for rows in result.partitions():
+            parser = parser or get_row_parser(rows[0], query=query, schema=schema, skip_validation=skip_validation)
+            yield list(map(parser, rows))
+    finally:
+        await result.close()
 
 
 async def paginate_query(
@@ -48,70 +99,471 @@ async def paginate_query(
     query: Select,
     page_params: PageParams,
     schema: Type[T_BaseModel] = None,
+    count_strategy: ECountStrategy = ECountStrategy.EXACT,
+    count_cache_ttl: int = 60,
+    concurrent: bool = False,
+    skip_validation: bool = False,
 ) -> PaginateResult[Union[T_BaseModel, dict]]:
-    """通用分页查询"""
-    # 计算总数
-    count_query = select(func.count()).select_from(query.subquery())
-    total = await db.scalar(count_query) or 0
+    """
+    通用分页查询
+    count_strategy 指定总数的统计方式，count_cache_ttl 为 CACHED 方式下缓存的秒数
+    concurrent 为 True 时总数和分页数据在两个独立连接上并发查询，看不到当前会话中未提交的数据，
+    两个会话沿用当前会话的读写分离路由
+    """
+    page, size = page_params.page, page_params.size
+    offset = (page - 1) * size
 
-    if total == 0:
-        # 无数据直接返回空分页结果
+    if count_strategy == ECountStrategy.SKIP:
+        # 不统计总数，多查一条判断是否有下一页
+        page_query = query.offset(offset).limit(size + 1)
+        result_list = await get_parsed_many(db, page_query, schema=schema, skip_validation=skip_validation)
         return PaginateResult(
-            items=[],
-            total=0,
-            page=page_params.page,
-            size=page_params.size,
-            pages=0,
+            items=result_list[:size],
+            total=None,
+            page=page,
+            size=size,
+            pages=None,
+            has_next=len(result_list) > size,
+            total_strategy=count_strategy,
         )
 
-    # 分页
-    offset = (page_params.page - 1) * page_params.size
-    result_list = await get_parsed_many(
-        db,
-        query=query.offset(offset).limit(page_params.size),
-        schema=schema,
-    )
+    page_query = query.offset(offset).limit(size)
+    if concurrent:
+        # 从连接池取两个连接，并发查询总数和分页数据
+        async with _make_concurrent_session(db) as count_db, _make_concurrent_session(db) as page_db:
+            (total, count_strategy), result_list = await _gather_or_cancel(
+                count_query(count_db, query, count_strategy, count_cache_ttl),
+                get_parsed_many(page_db, page_query, schema=schema, skip_validation=skip_validation),
+            )
+    else:
+        # 计算总数
+        total, count_strategy = await count_query(db, query, count_strategy, count_cache_ttl)
+        result_list = None
+
+    if total == 0 and count_strategy != ECountStrategy.ESTIMATED:
+        # 无数据直接返回空分页结果
+        result_list = []
+    elif result_list is None:
+        # 分页
+        result_list = await get_parsed_many(db, page_query, schema=schema, skip_validation=skip_validation)
+
+    pages = (total + size - 1) // size
     return PaginateResult(
         items=result_list,
         total=total,
-        page=page_params.page,
-        size=page_params.size,
-        pages=(total + page_params.size - 1) // page_params.size,
+        page=page,
+        size=size,
+        pages=pages,
+        has_next=page < pages,
+        total_strategy=count_strategy,
     )
 
 
+def _make_concurrent_session(db: AsyncSession) -> AsyncSession:
+    # 沿用原会话的路由信息（是否使用从库、已选的从库、是否写入过、请求内的写入时间），与原会话读同一个库
+    info = {key: db.info[key] for key in ('use_replica', 'replica', 'wrote', 'request_state') if key in db.info}
+    return AsyncSessionLocal(bind=db.bind or async_engine, info=info)
+
+
+async def _gather_or_cancel(*coros) -> list:
+    """并发执行，任一出错或自身被取消时取消其余任务并等待其结束，之后才能关闭任务使用的会话"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return [task.result() for task in tasks]
+
+
+async def count_query(
+    db: AsyncSession,
+    query: Select,
+    count_strategy: ECountStrategy = ECountStrategy.EXACT,
+    cache_ttl: int = 60,
+) -> Tuple[int, ECountStrategy]:
+    """按指定方式统计查询总数，返回总数和实际使用的统计方式"""
+    if count_strategy == ECountStrategy.ESTIMATED:
+        if db.get_bind().dialect.name == 'mysql':
+            try:
+                return await _estimate_count(db, query), count_strategy
+            except SQLAlchemyError as e:
+                # 估算失败时退回精确统计，不影响接口返回
+                logger.warning(f'Estimate count failed, fallback to exact count: {e}')
+        count_strategy = ECountStrategy.EXACT
+    if count_strategy == ECountStrategy.CACHED:
+        return await _cached_count(db, query, cache_ttl), count_strategy
+    count_stmt = select(func.count()).select_from(query.subquery())
+    return await db.scalar(count_stmt) or 0, ECountStrategy.EXACT
+
+
+async def _estimate_count(db: AsyncSession, query: Select) -> int:
+    """根据 MySQL EXPLAIN 的 rows * filtered 估算总数"""
+    # 展开 in_() 等延迟渲染的参数，否则 SQL 中为 __[POSTCOMPILE_xxx] 占位符
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[key] for key in compiled.positiontup or ())
+    conn = await db.connection()
+    result = await conn.exec_driver_sql(f'EXPLAIN {compiled.string}', params)
+    return _get_plan_estimate(result.mappings().all())
+
+
+def _get_plan_estimate(plans: Sequence[dict]) -> int:
+    """
+    连接查询的 EXPLAIN 每张表一行，外层查询（与首行 id 相同）各表按嵌套循环连接，估算值为各行 rows * filtered 的乘积；
+    其他 id 的行为子查询，只影响外层的 filtered，不计入
+    """
+    if not plans:
+        return 0
+    estimate = 1.0
+    for plan in plans:
+        if plan.get('id') != plans[0].get('id'):
+            continue
+        if not plan.get('rows'):
+            return 0
+        estimate *= plan['rows'] * float(plan.get('filtered') or 100) / 100
+    return int(estimate)
+
+
+async def _cached_count(db: AsyncSession, query: Select, ttl: int) -> int:
+    """精确统计总数并以编译后的 SQL 及参数为键缓存到 redis"""
+    compiled = query.compile(dialect=db.get_bind().dialect)
+    digest = hashlib.sha1(f'{compiled.string}|{sorted(compiled.params.items())!r}'.encode()).hexdigest()
+    key = COUNT_CACHE_PREFIX + digest
+    rds = None
+    try:
+        rds = await get_async_redis_connection()
+        cached = await rds.get(key)
+        if cached is not None:
+            return int(cached)
+    except RedisError as e:
+        logger.warning(f'Read count cache failed: {e}')
+    total, _ = await count_query(db, query)
+    if rds is not None:
+        try:
+            await rds.set(key, total, ex=ttl)
+        except RedisError as e:
+            logger.warning(f'Write count cache failed: {e}')
+    return total
+
+
+async def paginate_query_by_cursor(
+    db: AsyncSession,
+    query: Select,
+    cursor_params: CursorParams,
+    schema: Type[T_BaseModel] = None,
+    skip_validation: bool = False,
+) -> CursorResult[Union[T_BaseModel, dict]]:
+    """
+    通用游标分页查询（keyset 分页）
+    query 必须带有 order_by，且排序列组合唯一（通常在末尾追加主键），
+    不计算总数，不使用 OFFSET，翻页深度不影响查询耗时
+    """
+    order_columns = _get_order_columns(query)
+    direction, values = CURSOR_NEXT, None
+    if cursor_params.cursor:
+        direction, values = _decode_cursor(cursor_params.cursor, len(order_columns))
+    is_prev = direction == CURSOR_PREV
+
+    # 将排序列追加到查询末尾，用于生成游标，解析行数据时截掉
+    size = cursor_params.size
+    seek_query = query.add_columns(*(col.label(f'__cursor_{i}') for i, (col, _) in enumerate(order_columns)))
+    if values is not None:
+        seek_query = seek_query.where(_seek_condition(order_columns, values, is_prev))
+    if is_prev:
+        # 向前翻页时反转排序，查询结果再倒序回来
+        seek_query = seek_query.order_by(None).order_by(
+            *(col.asc() if is_desc else col.desc() for col, is_desc in order_columns)
+        )
+    # 多查一条用于判断是否还有更多数据
+    rows = (await db.execute(seek_query.limit(size + 1))).all()
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if is_prev:
+        rows.reverse()
+
+    key_count = len(order_columns)
+    items = [row[:-key_count] for row in rows]
+    if items:
+        parser = get_row_parser(items[0], query=query, schema=schema, skip_validation=skip_validation)
+        items = list(map(parser, items))
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or is_prev:
+            next_cursor = _encode_cursor(CURSOR_NEXT, rows[-1][-key_count:])
+        if (has_more and is_prev) or (values is not None and not is_prev):
+            prev_cursor = _encode_cursor(CURSOR_PREV, rows[0][-key_count:])
+    return CursorResult(items=items, size=size, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+async def bulk_insert(
+    db: AsyncSession,
+    entity: Union[Type[T_TableBase], Table],
+    rows: Iterable[dict],
+    chunk_size: int = 500,
+    assign_id: bool = True,
+) -> int:
+    """
+    批量插入，每 chunk_size 行执行一次 executemany，SQLAlchemy 会将其渲染为 INSERT ... VALUES (...), (...)，
+    语句只编译一次并复用缓存，返回插入的行数
+    assign_id 为 True 时为缺少主键的行分配雪花 ID（仅单列整型主键）
+    """
+    table = _get_table(entity)
+    count = 0
+    for chunk in _iter_bulk_chunks(table, rows, chunk_size, assign_id):
+        await db.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+async def bulk_upsert(
+    db: AsyncSession,
+    entity: Union[Type[T_TableBase], Table],
+    rows: Iterable[dict],
+    update_fields: Sequence[str] = None,
+    chunk_size: int = 500,
+    assign_id: bool = True,
+) -> int:
+    """
+    批量插入或更新，MySQL 使用 ON DUPLICATE KEY UPDATE，SQLite/PostgreSQL 使用 ON CONFLICT (主键) DO UPDATE
+    update_fields 为冲突时更新的字段，默认为除主键外的所有字段，为空列表时只插入不存在的行，已存在的行保持不变，
+    返回数据库报告的影响行数（MySQL 中插入计 1 行，更新计 2 行）
+    """
+    table = _get_table(entity)
+    dialect = db.get_bind().dialect.name
+    pk_names = [c.name for c in table.primary_key.columns]
+    count = 0
+    stmt = None
+    for chunk in _iter_bulk_chunks(table, rows, chunk_size, assign_id):
+        if stmt is None:
+            fields = [k for k in chunk[0] if k not in pk_names] if update_fields is None else update_fields
+            stmt = _upsert_statement(dialect, table, pk_names, fields)
+        result = await db.execute(stmt, chunk)
+        count += result.rowcount
+    return count
+
+
+def _upsert_statement(dialect: str, table: Table, pk_names: List[str], fields: Sequence[str]):
+    """没有需要更新的字段时冲突的行保持不变，MySQL 将主键更新为自身，不使用会忽略其他错误的 INSERT IGNORE"""
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        if not fields:
+            return stmt.on_duplicate_key_update({pk_names[0]: table.c[pk_names[0]]})
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in fields})
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+        if not fields:
+            return stmt.on_conflict_do_nothing(index_elements=pk_names)
+        return stmt.on_conflict_do_update(index_elements=pk_names, set_={f: stmt.excluded[f] for f in fields})
+    raise ValueError(f'bulk_upsert is not supported for dialect: {dialect}')
+
+
+def _get_table(entity: Union[Type[T_TableBase], Table]) -> Table:
+    return entity if isinstance(entity, Table) else entity.__table__
+
+
+def _iter_bulk_chunks(table: Table, rows: Iterable[dict], chunk_size: int, assign_id: bool):
+    """将行数据按 chunk_size 分块，并为缺少主键的行批量分配 ID"""
+    pk_columns = list(table.primary_key.columns)
+    id_name = None
+    if assign_id and len(pk_columns) == 1 and isinstance(pk_columns[0].type, Integer):
+        id_name = pk_columns[0].name
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        if id_name:
+            missing = [i for i, row in enumerate(chunk) if row.get(id_name) is None]
+            # 所有行都已有主键时不生成 ID，租约失效时仍可写入
+            for i, id_ in zip(missing, get_next_ids(len(missing)) if missing else ()):
+                chunk[i] = {**chunk[i], id_name: id_}
+        yield chunk
+
+
+def _get_order_columns(query: Select) -> List[Tuple[ColumnElement, bool]]:
+    """提取查询的排序列及是否倒序"""
+    order_columns = []
+    for clause in query._order_by_clauses:
+        is_desc = False
+        if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+            is_desc = clause.modifier is operators.desc_op
+            clause = clause.element
+        if isinstance(clause, Label):
+            clause = clause.element
+        if not isinstance(clause, ColumnElement) or isinstance(clause, UnaryExpression):
+            raise ValueError(f'Unsupported order by clause for cursor pagination: {clause}')
+        order_columns.append((clause, is_desc))
+    if not order_columns:
+        raise ValueError('query must be ordered for cursor pagination')
+    return order_columns
+
+
+def _seek_condition(order_columns: List[Tuple[ColumnElement, bool]], values: List[Any], is_prev: bool):
+    """生成 keyset 定位条件，排序方向一致时使用行值比较 (a, b) > (x, y)"""
+    directions = {is_desc for _, is_desc in order_columns}
+    if len(directions) == 1:
+        columns = [col for col, _ in order_columns]
+        left, right = (tuple_(*columns), tuple_(*values)) if len(columns) > 1 else (columns[0], values[0])
+        return left < right if directions.pop() != is_prev else left > right
+    # 排序方向混合时展开为 (a > x) OR (a = x AND b > y) ...
+    conditions = []
+    for i, (col, is_desc) in enumerate(order_columns):
+        seek = col < values[i] if is_desc != is_prev else col > values[i]
+        conditions.append(and_(*(c == v for (c, _), v in zip(order_columns[:i], values)), seek))
+    return or_(*conditions)
+
+
+def _encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    return value
+
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        if '$dt' in value:
+            return datetime.fromisoformat(value['$dt'])
+        if '$d' in value:
+            return date.fromisoformat(value['$d'])
+        if '$dec' in value:
+            return Decimal(value['$dec'])
+    return value
+
+
+def _encode_cursor(direction: str, values) -> str:
+    """将翻页方向和排序列的值编码为不透明的游标"""
+    payload = json.dumps([direction, [_encode_cursor_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str, key_count: int) -> Tuple[str, List[Any]]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(payload)
+        if direction not in (CURSOR_NEXT, CURSOR_PREV) or len(values) != key_count:
+            raise ValueError(cursor)
+        return direction, [_decode_cursor_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise Http400BadRequest('无效的分页游标')
+
+
+class RowParser:
+    """
+    预编译的行解析器
+    按查询列名和行结构预先计算每个位置对应的列名、是否为列表列以及构造方法，解析时不再逐行推导
+    """
+
+    __slots__ = ('plain', 'names', 'slots', 'list_names', 'separator', 'build')
+
+    def __init__(
+        self,
+        query_keys: Tuple[str, ...],
+        layout: Tuple[int, ...],
+        schema: Type[T_BaseModel] = None,
+        skip_validation: bool = False,
+    ):
+        # layout 中每项为行内对应实体占用的查询列数，普通列为 0
+        slots = []
+        key_index = 0
+        for position, width in enumerate(layout):
+            if width:
+                slots.append((position, None, False))
+                key_index += width
+                continue
+            if key_index >= len(query_keys):
+                raise ValueError(f'Row data does not match query keys: {list(query_keys)}')
+            name = query_keys[key_index]
+            is_list = name.endswith('.list')
+            slots.append((position, name[:-5] if is_list else name, is_list))
+            key_index += 1
+        self.plain = all(name is not None for _, name, _ in slots)
+        self.names = tuple(name for _, name, _ in slots)
+        self.slots = tuple(slots)
+        self.list_names = tuple(name for _, name, is_list in slots if is_list)
+        self.separator = settings.ZERO_WORD
+        self.build = None
+        if schema:
+            self.build = schema.model_construct if skip_validation else schema
+
+    def __call__(self, row: Row):
+        if self.plain:
+            parsed = dict(zip(self.names, row))
+            for name in self.list_names:
+                value = parsed[name]
+                parsed[name] = value.split(self.separator) if value else []
+        else:
+            parsed = {}
+            for position, name, is_list in self.slots:
+                item = row[position]
+                if name is None:
+                    item is None or parsed.update(item.to_dict())
+                elif is_list:
+                    parsed[name] = item.split(self.separator) if item else []
+                else:
+                    parsed[name] = item
+        return self.build(**parsed) if self.build else parsed
+
+
+@lru_cache(maxsize=512)
+def _compile_row_parser(
+    query_keys: Tuple[str, ...],
+    layout: Tuple[int, ...],
+    schema: Optional[Type[T_BaseModel]],
+    skip_validation: bool,
+) -> RowParser:
+    return RowParser(query_keys, layout, schema, skip_validation)
+
+
+def get_row_parser(
+    row: Row,
+    *,
+    query: Select = None,
+    query_keys: List[str] = None,
+    schema: Type[T_BaseModel] = None,
+    skip_validation: bool = False,
+) -> RowParser:
+    """
+    根据查询列名和行结构获取行解析器，相同结构的查询共用缓存
+    传入 query 时按查询推导行结构，与行数据无关，外连接未匹配（实体为 None）的行不会影响之后的行；
+    只传入 query_keys 时按行数据推导
+    """
+    if query is None and query_keys is None:
+        raise ValueError('query or query_keys must be provided')
+    if query_keys is None:
+        query_keys = tuple(c.name for c in query.selected_columns)
+        layout = _get_query_layout(query)
+    else:
+        query_keys = tuple(query_keys)
+        layout = tuple(len(item.to_dict()) if hasattr(item, 'to_dict') else 0 for item in row)
+    return _compile_row_parser(query_keys, layout, schema, skip_validation)
+
+
+def _get_query_layout(query: Select) -> Tuple[int, ...]:
+    """查询中每一项在查询列名中占用的列数，ORM 实体展开为其映射的所有列，普通列为 0"""
+    layout = []
+    for description in query.column_descriptions:
+        entity = description.get('entity')
+        if entity is not None and isinstance(description['type'], type):
+            layout.append(len(sa_inspect(entity).mapper.column_attrs))
+        else:
+            layout.append(0)
+    return tuple(layout)
+
+
 def parse_row(
     row: Row,
     *,
     query: Select = None,
     query_keys: List[str] = None,
     schema: Type[T_BaseModel] = None,
+    skip_validation: bool = False,
 ):
     """解析行数据，将元组或复杂对象解析为字典"""
-    try:
-        # 提取列名
-        if query is None and query_keys is None:
-            raise ValueError('query or query_keys must be provided')
-        query_keys = query_keys or [c.name for c in query.c]
-        parsed = {}
-        key_index = 0
-        row = row if hasattr(row, '__iter__') else (row,)
-        # # 如果是只查某个实体，则直接返回
-        # if len(row) == 1 and schema is None and isinstance(row[0], TableBase):
-        #     return row[0]
-        for item in row:
-            if hasattr(item, 'to_dict'):  # 如果对象有 to_dict 方法
-                dic = item.to_dict()
-                parsed.update(dic)
-                key_index += len(dic)
-            else:
-                name = query_keys[key_index]
-                is_list = name.endswith('.list')
-                name = name[:-5] if is_list else name
-                if is_list:
-                    item = item.split(settings.ZERO_WORD) if item else []
-                parsed[name] = item
-                key_index += 1
-        return schema(**parsed) if schema else parsed
-    except IndexError:
-        raise ValueError(f'Row data does not match query keys: {query_keys}')
+    row = row if hasattr(row, '__iter__') else (row,)
+    parser = get_row_parser(row, query=query, query_keys=query_keys, schema=schema, skip_validation=skip_validation)
+    return parser(row)
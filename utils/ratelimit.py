@@ -0,0 +1,208 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from redis import RedisError
+from redis.exceptions import NoScriptError
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import settings
+from schemas.common import EResponseCode, FailResponse
+from utils.connect import get_async_redis_batcher
+from utils.logger import logger
+from utils.response import FastJSONResponse
+from utils.security import verify_token
+
+# 滑动窗口计数，按上一窗口剩余的时间占比加权估算当前窗口内的请求数
+# KEYS: 当前窗口, 上一窗口; ARGV: 上限, 窗口毫秒数, 当前毫秒时间戳, 已在本地放行的请求数
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local served = tonumber(ARGV[4])
+local current = tonumber(redis.call('get', KEYS[1]) or '0') + served
+local previous = tonumber(redis.call('get', KEYS[2]) or '0')
+local elapsed = now % window
+local estimated = previous * (window - elapsed) / window + current
+local allowed = 0
+if estimated + 1 <= limit then
+    allowed = 1
+    current = current + 1
+    estimated = estimated + 1
+end
+if current > 0 then
+    redis.call('set', KEYS[1], current, 'PX', window * 2)
+end
+local retry_after = 0
+if allowed == 0 then
+    retry_after = window - elapsed
+    if previous > 0 and current < limit then
+        retry_after = math.min(retry_after, math.ceil(window * (estimated + 1 - limit) / previous))
+    end
+end
+return {allowed, math.floor(math.max(limit - estimated, 0)), retry_after}
+"""
+
+# 令牌桶，KEYS: 桶; ARGV: 容量, 每毫秒补充的令牌数, 当前毫秒时间戳, 已在本地放行的请求数
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local served = tonumber(ARGV[4])
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate) - served
+local allowed = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+end
+redis.call('hset', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate))
+local retry_after = 0
+if allowed == 0 then
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+return {allowed, math.floor(math.max(tokens, 0)), retry_after}
+"""
+
+SCRIPTS = {'sliding_window': SLIDING_WINDOW_SCRIPT, 'token_bucket': TOKEN_BUCKET_SCRIPT}
+
+_rate_limit_stats = dict(local_hits=0, redis_checks=0, limited=0, errors=0)
+
+
+class RateLimitMiddleware:
+    """
+    基于 redis 的限流中间件，支持滑动窗口和令牌桶，按 IP / 用户 / 路由组合限流，超出时返回 429
+    redis 返回的剩余额度按 local_ratio 均分给各 worker 作为本地额度，额度内的请求不访问 redis，
+    本地放行的请求数在下次访问 redis 时一并上报；redis 不可用时放行
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        enabled: bool = settings.RATE_LIMIT_ENABLED,
+        algorithm: str = settings.RATE_LIMIT_ALGORITHM,
+        key_by: Sequence[str] = tuple(settings.RATE_LIMIT_KEY_BY),
+        requests: int = settings.RATE_LIMIT_REQUESTS,
+        window: float = settings.RATE_LIMIT_WINDOW,
+        local_ratio: float = settings.RATE_LIMIT_LOCAL_RATIO,
+        local_size: int = 10000,
+        prefix: str = 'ratelimit:',
+    ):
+        if algorithm not in SCRIPTS:
+            raise ValueError(f'Unknown rate limit algorithm: {algorithm}')
+        self.app = app
+        self.enabled = enabled
+        self.algorithm = algorithm
+        self.key_by = key_by
+        self.requests = requests
+        self.window_ms = int(window * 1000)
+        self.local_ratio = local_ratio
+        self.local_size = local_size
+        self.prefix = prefix
+        self.script = SCRIPTS[algorithm]
+        self.script_sha = hashlib.sha1(self.script.encode()).hexdigest()
+        # key -> [本地已放行未上报的请求数, 本地剩余额度, 额度过期时间]
+        self._local: OrderedDict[str, List] = OrderedDict()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.enabled or scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            return await self.app(scope, receive, send)
+        allowed, retry_after = await self.check(self.make_key(scope))
+        if allowed:
+            return await self.app(scope, receive, send)
+        _rate_limit_stats['limited'] += 1
+        response = FastJSONResponse(
+            status_code=EResponseCode.TOO_MANY_REQUESTS,
+            content=FailResponse(msg='请求过于频繁，请稍后重试', code=EResponseCode.TOO_MANY_REQUESTS),
+            headers={'Retry-After': str(max(math.ceil(retry_after), 1))},
+        )
+        await response(scope, receive, send)
+
+    def make_key(self, scope: Scope) -> str:
+        client = scope.get('client')
+        ip = client[0] if client else 'unknown'
+        parts = []
+        for part in self.key_by:
+            if part == 'user':
+                user_id = _get_user_id(scope)
+                parts.append(f'user:{user_id}' if user_id is not None else f'ip:{ip}')
+            elif part == 'route':
+                parts.append(f'route:{scope["method"]}:{_get_route_path(scope)}')
+            else:
+                parts.append(f'ip:{ip}')
+        return f'{self.prefix}{self.algorithm}:' + '|'.join(parts)
+
+    async def check(self, key: str) -> Tuple[bool, float]:
+        """返回 (是否放行, 多少秒后重试)"""
+        now = time.monotonic()
+        entry = self._local.get(key)
+        if entry is not None and entry[1] > 0 and entry[2] > now:
+            entry[0] += 1
+            entry[1] -= 1
+            _rate_limit_stats['local_hits'] += 1
+            return True, 0
+        if entry is None:
+            entry = self._local[key] = [0, 0, 0.0]
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        else:
+            self._local.move_to_end(key)
+        served, entry[0] = entry[0], 0
+
+        _rate_limit_stats['redis_checks'] += 1
+        try:
+            allowed, remaining, retry_after = await self._eval(key, served)
+        except RedisError as e:
+            _rate_limit_stats['errors'] += 1
+            logger.warning(f'Rate limit check failed: {e}')
+            return True, 0
+        entry[1] = int(remaining * self.local_ratio / settings.WEB_WORKERS)
+        entry[2] = now + self.window_ms / 1000 * self.local_ratio
+        return bool(allowed), retry_after / 1000
+
+    async def _eval(self, key: str, served: int) -> List[int]:
+        now_ms = int(time.time() * 1000)
+        if self.algorithm == 'sliding_window':
+            index = now_ms // self.window_ms
+            keys = [f'{key}:{index}', f'{key}:{index - 1}']
+            args = [self.requests, self.window_ms, now_ms, served]
+        else:
+            keys = [key]
+            args = [self.requests, self.requests / self.window_ms, now_ms, served]
+        rds = await get_async_redis_batcher()
+        try:
+            return await rds.evalsha(self.script_sha, len(keys), *keys, *args)
+        except NoScriptError:
+            # EVAL 同时会缓存脚本，之后的 EVALSHA 可以命中
+            return await rds.eval(self.script, len(keys), *keys, *args)
+
+
+def _get_user_id(scope: Scope) -> Optional[int]:
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            return verify_token(token) if scheme.lower() == 'bearer' and token else None
+    return None
+
+
+def _get_route_path(scope: Scope) -> str:
+    """中间件在路由之前执行，匹配路由模板，避免路径参数不同的请求各自计数"""
+    app = scope.get('app')
+    for route in getattr(getattr(app, 'router', None), 'routes', ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'path', '') or scope['path']
+    return scope['path']
+
+
+def get_rate_limit_stats() -> Dict[str, int]:
+    return dict(_rate_limit_stats)
+
+
+__all__ = ['RateLimitMiddleware', 'get_rate_limit_stats']
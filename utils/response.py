@@ -0,0 +1,158 @@
+import csv
+import functools
+import inspect
+import io
+from decimal import Decimal
+from typing import Any, AsyncIterable, List, Optional, Sequence, Union
+from urllib.parse import quote
+
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from pydantic_core import to_json, to_jsonable_python
+
+from schemas.common import T_BaseModel
+
+T_Batches = AsyncIterable[List[Union[T_BaseModel, dict]]]
+
+
+def _orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode='json', by_alias=True)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    # 其余 orjson 不支持的类型（set、bytes、Enum 之外的自定义类型等）交给 pydantic 转换
+    return to_jsonable_python(obj, by_alias=True)
+
+
+def orjson_dumps(value: Any) -> bytes:
+    """使用 orjson 序列化，支持嵌套的 pydantic 模型（按别名输出）、Decimal 和 pydantic 能转换的其他类型"""
+    return orjson.dumps(value, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON 响应类，pydantic 模型由 pydantic-core 直接序列化为 bytes，其余内容使用 orjson，
+    不经过 model_dump 生成中间字典，也不使用标准库 json
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            # 与 FastAPI 默认的处理一致，按别名输出字段
+            return content.__pydantic_serializer__.to_json(content, by_alias=True)
+        return orjson_dumps(content)
+
+
+def _uses_response_param(dependant: Dependant) -> bool:
+    return bool(dependant.response_param_name) or any(_uses_response_param(d) for d in dependant.dependencies)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    未声明响应模型的接口返回 pydantic 模型、字典或列表时直接包装为 FastJSONResponse，跳过 jsonable_encoder 的逐字段转换
+    声明了响应模型、指定了响应类或使用 Response 参数设置响应头的接口保持 FastAPI 原有的处理，
+    声明了响应模型时 FastAPI 已由 pydantic-core 直接序列化为 JSON，不要将 FastJSONResponse 设为应用的默认响应类，
+    否则 FastAPI 会关闭该处理
+    （只检查路由自身的依赖，include_router 时追加的依赖不要通过 Response 参数设置响应头）
+    使用方式：APIRouter(route_class=FastJSONRoute)
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        self.fast_path = False
+        if inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kw):
+                return self._wrap_result(await endpoint(*args, **kw))
+
+        elif inspect.isfunction(endpoint) and not inspect.isgeneratorfunction(endpoint):
+
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kw):
+                return self._wrap_result(endpoint(*args, **kw))
+
+        else:
+            wrapper = endpoint
+        super().__init__(path, wrapper, **kwargs)
+        self.fast_path = (
+            self.response_field is None
+            and isinstance(self.response_class, DefaultPlaceholder)
+            and not _uses_response_param(self.dependant)
+        )
+
+    def _wrap_result(self, result):
+        if self.fast_path and isinstance(result, (BaseModel, dict, list)):
+            return FastJSONResponse(result, status_code=self.status_code or 200)
+        return result
+
+
+def _dump_item(item: Union[BaseModel, dict]) -> dict:
+    """模型和字典统一由 pydantic-core 转换为 JSON 兼容的值，日期、Decimal 等的输出格式一致"""
+    return to_jsonable_python(item)
+
+
+def _csv_value(value):
+    # 列表和嵌套对象以 JSON 写入单元格
+    return orjson.dumps(value).decode() if isinstance(value, (list, dict)) else value
+
+
+def _attachment_headers(filename: Optional[str]) -> Optional[dict]:
+    if not filename:
+        return None
+    return {'Content-Disposition': f"attachment; filename*=utf-8''{quote(filename)}"}
+
+
+async def _iter_ndjson(batches: T_Batches):
+    async for batch in batches:
+        if batch:
+            yield b'\n'.join(map(to_json, batch)) + b'\n'
+
+
+async def _iter_csv(batches: T_Batches, fieldnames: Optional[Sequence[str]]):
+    buffer = io.StringIO()
+    writer = None
+    async for batch in batches:
+        for item in batch:
+            row = {key: _csv_value(value) for key, value in _dump_item(item).items()}
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=fieldnames or list(row), extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+        # 每批写完后输出并清空缓冲区
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def ndjson_streaming_response(batches: T_Batches, filename: Optional[str] = None) -> StreamingResponse:
+    """
+    将按批次产出的数据以 NDJSON 格式流式写回客户端
+    batches 通常来自 utils.query.stream_parsed_many，其会话需在响应发送完毕后再关闭
+    """
+    return StreamingResponse(
+        _iter_ndjson(batches),
+        media_type='application/x-ndjson',
+        headers=_attachment_headers(filename),
+    )
+
+
+def csv_streaming_response(
+    batches: T_Batches,
+    fieldnames: Optional[Sequence[str]] = None,
+    filename: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    将按批次产出的数据以 CSV 格式流式写回客户端
+    未指定 fieldnames 时以第一条数据的字段作为表头
+    """
+    return StreamingResponse(
+        _iter_csv(batches, fieldnames),
+        media_type='text/csv; charset=utf-8',
+        headers=_attachment_headers(filename),
+    )
+
+
+__all__ = ['FastJSONResponse', 'FastJSONRoute', 'orjson_dumps', 'ndjson_streaming_response', 'csv_streaming_response']
@@ -1,11 +1,20 @@
+import asyncio
+import hashlib
+import json
 import time
-from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Dict, List, Tuple, Any
 
 import jwt
+from redis import RedisError
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 
 from config import settings
+from utils.connect import get_async_redis_batcher
+from utils.errors import Http503ServiceUnavailable
+from utils.logger import logger
 
 PWD_CONTEXT = CryptContext(schemes=['pbkdf2_sha256'], deprecated='auto')
 OAUTH2_SCHEME = OAuth2PasswordBearer(tokenUrl=settings.API_V1_PREFIX + '/auth/token')
@@ -13,6 +22,7 @@ JWT_SECRET_KEY = settings.JWT_SECRET_KEY
 JWT_ALGORITHM = settings.JWT_ALGORITHM
 JWT_ATK_EXPIRE = settings.JWT_ATK_EXP_DELTA
 JWT_RTK_EXPIRE = settings.JWT_RTK_EXP_DELTA
+TOKEN_DENY_PREFIX = 'auth:deny:'
 
 
 def get_password_hash(password: str):
@@ -23,16 +33,161 @@ def verify_password(plain_password: str, hashed_password: str):
     return PWD_CONTEXT.verify(plain_password, hashed_password)
 
 
+# 密码哈希在独立的有界执行器中运行，避免阻塞事件循环，排队过多时直接拒绝
+__hash_executor: Optional[Executor] = None
+__hash_semaphore: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+_hash_stats = dict(waiting=0, running=0, completed=0, failed=0, rejected=0)
+
+
+def _get_hash_executor() -> Executor:
+    global __hash_executor
+    if __hash_executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == 'process':
+            # 多进程绕开 GIL，适合 CPU 核数充足且哈希较慢的场景
+            __hash_executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            __hash_executor = ThreadPoolExecutor(settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+    return __hash_executor
+
+
+def _get_hash_semaphore() -> asyncio.Semaphore:
+    # 与 redis 连接锁相同，信号量绑定首次等待时的事件循环，每个事件循环使用各自的信号量
+    global __hash_semaphore
+    loop = asyncio.get_running_loop()
+    if __hash_semaphore is None or __hash_semaphore[0] is not loop:
+        __hash_semaphore = (loop, asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS))
+    return __hash_semaphore[1]
+
+
+async def _run_in_hash_executor(func, *args):
+    if _hash_stats['waiting'] >= settings.PASSWORD_HASH_MAX_PENDING:
+        _hash_stats['rejected'] += 1
+        raise Http503ServiceUnavailable('服务繁忙，请稍后重试')
+    semaphore = _get_hash_semaphore()
+    _hash_stats['waiting'] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _hash_stats['waiting'] -= 1
+    _hash_stats['running'] += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_hash_executor(), func, *args)
+    except BaseException:
+        _hash_stats['failed'] += 1
+        raise
+    finally:
+        _hash_stats['running'] -= 1
+        semaphore.release()
+    _hash_stats['completed'] += 1
+    return result
+
+
+async def async_get_password_hash(password: str) -> str:
+    """在密码哈希执行器中计算哈希"""
+    return await _run_in_hash_executor(get_password_hash, password)
+
+
+async def async_verify_password(plain_password: str, hashed_password: str) -> bool:
+    """在密码哈希执行器中校验密码"""
+    return await _run_in_hash_executor(verify_password, plain_password, hashed_password)
+
+
+def get_password_hash_stats() -> Dict[str, int]:
+    """密码哈希执行器的统计，waiting 为排队深度"""
+    return dict(_hash_stats, workers=settings.PASSWORD_HASH_WORKERS)
+
+
+def shutdown_password_hash_executor():
+    global __hash_executor
+    if __hash_executor is not None:
+        __hash_executor.shutdown(wait=False, cancel_futures=True)
+        __hash_executor = None
+
+
+class JWTKeySet:
+    """
+    JWT 密钥集合，密钥对象只解析一次
+    签名使用 signing_kid 对应的密钥，验签按令牌头部的 kid 选择密钥；
+    轮换时先加入新密钥并切换签名密钥，旧密钥保留到已签发的令牌过期后再移除
+    """
+
+    def __init__(self, keys: Dict[Optional[str], Tuple[Any, str]], signing_kid: Optional[str] = None):
+        if signing_kid not in keys:
+            raise ValueError(f'JWT signing key not found: {signing_kid}')
+        self.keys = keys  # kid -> (密钥对象, 算法)
+        self.signing_kid = signing_kid
+        self.signing_key, self.signing_algorithm = keys[signing_kid]
+        self.headers = {'kid': signing_kid} if signing_kid else None
+
+    @classmethod
+    def from_jwks(cls, jwks: dict, signing_kid: Optional[str] = None) -> 'JWTKeySet':
+        """从 JWKS 创建，未指定签名密钥时使用第一个私钥"""
+        keys = {}
+        for jwk_data in jwks['keys']:
+            jwk = jwt.PyJWK(jwk_data)
+            if not jwk.key_id:
+                raise ValueError('JWK without kid')
+            keys[jwk.key_id] = (jwk.key, jwk.algorithm_name)
+            if signing_kid is None and _is_signing_key(jwk.key):
+                signing_kid = jwk.key_id
+        key_set = cls(keys, signing_kid)
+        if not _is_signing_key(key_set.signing_key):
+            raise ValueError(f'JWT signing key {signing_kid} has no private part')
+        return key_set
+
+    def get_verification_key(self, kid: Optional[str]) -> Optional[Tuple[Any, str]]:
+        """没有 kid 的令牌使用签名密钥验签"""
+        return self.keys.get(kid if kid is not None else self.signing_kid)
+
+    def get_public_jwks(self) -> dict:
+        """公开的验签密钥，对称密钥不公开"""
+        keys = []
+        for kid, (key, algorithm) in self.keys.items():
+            if kid is None or isinstance(key, bytes):
+                continue
+            public_key = key.public_key() if _is_signing_key(key) else key
+            jwk = jwt.get_algorithm_by_name(algorithm).to_jwk(public_key, as_dict=True)
+            keys.append(dict(jwk, kid=kid, alg=algorithm, use='sig'))
+        return dict(keys=keys)
+
+
+def _is_signing_key(key) -> bool:
+    # 对称密钥为 bytes，非对称私钥可以导出公钥
+    return isinstance(key, bytes) or hasattr(key, 'public_key')
+
+
+def load_jwt_keys() -> JWTKeySet:
+    """配置了 JWT_JWKS_PATH 时从 JWKS 文件加载，否则使用 JWT_SECRET_KEY 和 JWT_ALGORITHM"""
+    if not settings.JWT_JWKS_PATH:
+        return JWTKeySet({None: (JWT_SECRET_KEY.encode(), JWT_ALGORITHM)})
+    with open(settings.JWT_JWKS_PATH) as f:
+        return JWTKeySet.from_jwks(json.load(f), settings.JWT_SIGNING_KID)
+
+
+jwt_keys = load_jwt_keys()
+
+
+def reload_jwt_keys():
+    """重新加载密钥，已移除的密钥签发的令牌立即失效"""
+    global jwt_keys
+    jwt_keys = load_jwt_keys()
+    _token_cache.clear()
+
+
+def _encode_token(payload: dict) -> str:
+    return jwt.encode(payload, jwt_keys.signing_key, algorithm=jwt_keys.signing_algorithm, headers=jwt_keys.headers)
+
+
 def create_atk(user_id: int):
     """创建访问令牌"""
-    atk_exp = int(time.time() + JWT_ATK_EXPIRE)
-    return jwt.encode(dict(sub=str(user_id), exp=atk_exp), JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    now = time.time()
+    return _encode_token(dict(sub=str(user_id), iat=now, exp=int(now + JWT_ATK_EXPIRE)))
 
 
 def create_rtk(user_id: int):
     """创建刷新令牌"""
-    rtk_exp = int(time.time() + JWT_RTK_EXPIRE)
-    return jwt.encode(dict(sub=str(user_id), exp=rtk_exp), JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+    now = time.time()
+    return _encode_token(dict(sub=str(user_id), iat=now, exp=int(now + JWT_RTK_EXPIRE)))
 
 
 def create_tk_pair(user_id: int):
@@ -40,10 +195,100 @@ def create_tk_pair(user_id: int):
     return dict(access_token=create_atk(user_id), refresh_token=create_rtk(user_id))
 
 
+# 已验证的令牌缓存：令牌摘要 -> [过期时间, 用户 id（已吊销为 None）, 签发时间, 下次检查吊销名单的时间]
+_token_cache: 'OrderedDict[bytes, List]' = OrderedDict()
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _decode_token(token: str) -> Optional[List]:
+    try:
+        verification_key = jwt_keys.get_verification_key(jwt.get_unverified_header(token).get('kid'))
+        if verification_key is None:
+            return None
+        key, algorithm = verification_key
+        payload = jwt.decode(token, key, algorithms=[algorithm])
+        return [payload['exp'], int(payload['sub']), payload.get('iat', 0), 0.0]
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _get_verified_token(token: str, digest: bytes) -> Optional[List]:
+    """从缓存获取已验证的令牌，未命中时解码验签并缓存到过期时间"""
+    entry = _token_cache.get(digest)
+    if entry is not None:
+        if entry[0] > time.time():
+            try:
+                _token_cache.move_to_end(digest)
+            except KeyError:  # 其他线程已淘汰
+                pass
+            return entry
+        _token_cache.pop(digest, None)
+        return None
+    entry = _decode_token(token)
+    if entry is None or settings.TOKEN_CACHE_SIZE <= 0:
+        return entry
+    _token_cache[digest] = entry
+    while len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+        try:
+            _token_cache.popitem(last=False)
+        except KeyError:
+            break
+    return entry
+
+
 def verify_token(token: str) -> Optional[int]:
-    """验证令牌"""
+    """验证令牌，只验签，不检查吊销名单"""
+    entry = _get_verified_token(token, _token_digest(token))
+    return entry[1] if entry else None
+
+
+async def authenticate_token(token: str) -> Optional[int]:
+    """
+    验证令牌并检查吊销名单，返回用户 id
+    同一令牌在 TOKEN_DENYLIST_CHECK_INTERVAL 内只检查一次 redis，令牌和用户的吊销记录在一次 MGET 中查询，
+    并发请求的查询会合并到同一个 pipeline；redis 不可用时只验签
+    """
+    digest = _token_digest(token)
+    entry = _get_verified_token(token, digest)
+    if entry is None or entry[1] is None:
+        return None
+    if entry[3] > time.monotonic():
+        return entry[1]
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-        return int(payload.get('sub', None))
-    except jwt.PyJWTError or ValueError:
+        rds = await get_async_redis_batcher()
+        token_revoked, revoked_before = await rds.mget(
+            f'{TOKEN_DENY_PREFIX}token:{digest.hex()}', f'{TOKEN_DENY_PREFIX}user:{entry[1]}'
+        )
+    except RedisError as e:
+        logger.warning(f'Check token denylist failed: {e}')
+        return entry[1]
+    if token_revoked or (revoked_before and entry[2] <= float(revoked_before)):
+        entry[1] = None
         return None
+    entry[3] = time.monotonic() + settings.TOKEN_DENYLIST_CHECK_INTERVAL
+    return entry[1]
+
+
+async def revoke_token(token: str):
+    """吊销单个令牌（如退出登录），记录保留到令牌过期"""
+    digest = _token_digest(token)
+    entry = _get_verified_token(token, digest)
+    if entry is None:
+        return
+    entry[1] = None
+    ttl = int(entry[0] - time.time()) + 1
+    rds = await get_async_redis_batcher()
+    await rds.set(f'{TOKEN_DENY_PREFIX}token:{digest.hex()}', 1, ex=ttl)
+
+
+async def revoke_user_tokens(user_id: int):
+    """吊销用户在此之前签发的所有令牌（如修改密码），记录保留到刷新令牌过期"""
+    now = time.time()
+    for entry in list(_token_cache.values()):
+        if entry[1] == user_id and entry[2] <= now:
+            entry[1] = None
+    rds = await get_async_redis_batcher()
+    await rds.set(f'{TOKEN_DENY_PREFIX}user:{user_id}', now, ex=JWT_RTK_EXPIRE)
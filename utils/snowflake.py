@@ -1,11 +1,46 @@
+import asyncio
+import os
+import socket
 import threading
 import time
+import uuid
+from array import array
+from typing import Optional, Tuple
 
+from config import settings
+from utils.logger import logger
 
-def _get_worker_id():
-    tid = threading.get_ident()
-    worker_id = tid % 1024  # 限制 worker_id 范围
-    return worker_id
+LEASE_KEY_PREFIX = 'snowflake:worker:'
+# 位布局，各部分位数之和不超过 53 时可在 JS 中安全表示，最多 63 位
+LAYOUT = dict(
+    timestamp_bits=settings.SNOWFLAKE_TIMESTAMP_BITS,
+    data_center_id_bits=settings.SNOWFLAKE_DATA_CENTER_BITS,
+    worker_id_bits=settings.SNOWFLAKE_WORKER_BITS,
+    sequence_bits=settings.SNOWFLAKE_SEQUENCE_BITS,
+)
+WORKER_COUNT = 1 << settings.SNOWFLAKE_WORKER_BITS
+SLOT_COUNT = (1 << settings.SNOWFLAKE_DATA_CENTER_BITS) * WORKER_COUNT  # 可分配的 (数据中心, 机器) 标识数量
+SLOT_STEP = 1 << settings.SNOWFLAKE_THREAD_SLOT_BITS  # 每个进程占用的连续机器标识数量
+
+# 仅在租约属于自己时续期/释放
+_RENEW_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+)
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def _get_static_slot() -> Tuple[int, int]:
+    """
+    不使用 redis 租约时的 (数据中心, 机器) 标识
+    优先使用配置的固定标识，否则由进程号推导，同一主机上的多个 worker 进程互不相同（进程号相差 SLOT_COUNT 的倍数除外）
+    """
+    data_center_id, worker_id = settings.SNOWFLAKE_DATA_CENTER_ID, settings.SNOWFLAKE_WORKER_ID
+    pid = os.getpid()
+    if worker_id is None:
+        if data_center_id is None:
+            return divmod(pid % (SLOT_COUNT // SLOT_STEP) * SLOT_STEP, WORKER_COUNT)
+        worker_id = pid % (WORKER_COUNT // SLOT_STEP) * SLOT_STEP
+    return data_center_id or 0, worker_id
 
 
 def _current_timestamp():
@@ -14,30 +49,48 @@ def _current_timestamp():
 
 
 def _wait_for_next_timestamp(last_timestamp):
-    """等待直到下一毫秒"""
+    """等待直到下一毫秒，短暂休眠而不是空转占用 CPU"""
     timestamp = _current_timestamp()
     while timestamp <= last_timestamp:
+        time.sleep(max(last_timestamp + 1 - time.time() * 1000, 0.05) / 1000)
         timestamp = _current_timestamp()
     return timestamp
 
 
 class UniqueIDGenerator:
-    def __init__(self, worker_id, data_center_id=0):
+    def __init__(
+        self,
+        worker_id,
+        data_center_id=0,
+        *,
+        timestamp_bits=31,
+        data_center_id_bits=5,
+        worker_id_bits=5,
+        sequence_bits=12,
+        max_clock_skew=2000,
+    ):
         # 初始配置
+        self.lease_expires_at: Optional[float] = None  # 机器标识租约的本地过期时间，None 表示不使用租约
         self.worker_id = worker_id  # 唯一机器标识符
         self.data_center_id = data_center_id  # 数据中心标识符，默认为 0
         self.sequence = 0  # 毫秒内的序列号
         self.last_timestamp = -1  # 上次生成 ID 的时间戳
+        self.max_clock_skew = max_clock_skew  # 容忍的时钟回拨（毫秒），期间沿用上次的时间戳
+        self.generated = 0  # 已生成的 ID 数量，用于监控
 
-        # 各种配置参数
-        self.worker_id_bits = 5  # 工作机器标识符占用 5 位
-        self.data_center_id_bits = 5  # 数据中心标识符占用 5 位
-        self.sequence_bits = 12  # 序列号占用 12 位
+        # 各种配置参数，默认 31 + 5 + 5 + 12 = 53 位
+        self.timestamp_bits = timestamp_bits  # 时间戳占用位数，超出部分被掩码截断，31 位约 24.8 天循环一次
+        self.worker_id_bits = worker_id_bits  # 工作机器标识符占用位数
+        self.data_center_id_bits = data_center_id_bits  # 数据中心标识符占用位数
+        self.sequence_bits = sequence_bits  # 序列号占用位数
+        total_bits = timestamp_bits + data_center_id_bits + worker_id_bits + sequence_bits
+        if total_bits > 63:
+            raise ValueError(f'Snowflake id layout too wide: {total_bits} bits')
 
         # 各部分的最大值
-        self.max_worker_id = (1 << self.worker_id_bits) - 1  # 31
-        self.max_data_center_id = (1 << self.data_center_id_bits) - 1  # 31
-        self.max_sequence = (1 << self.sequence_bits) - 1  # 4095
+        self.max_worker_id = (1 << self.worker_id_bits) - 1
+        self.max_data_center_id = (1 << self.data_center_id_bits) - 1
+        self.max_sequence = (1 << self.sequence_bits) - 1
 
         # 时间戳的偏移量，设为自定义起始时间（如 2020-01-01）
         self.start_timestamp = 1609459200000  # 2021-01-01 00:00:00（毫秒）
@@ -47,47 +100,260 @@ class UniqueIDGenerator:
         self.data_center_id_shift = self.sequence_bits + self.worker_id_bits
         self.timestamp_shift = self.sequence_bits + self.worker_id_bits + self.data_center_id_bits
 
-        # 53 位掩码
-        self.mask = 0x1FFFFFFFFFFFFF  # 53 位最大值
+        # 总位数掩码
+        self.mask = (1 << total_bits) - 1
 
         self.lock = threading.Lock()  # 锁，确保线程安全
+        self.assign(worker_id, data_center_id)
+
+    def assign(self, worker_id, data_center_id=0, lease_expires_at: Optional[float] = None):
+        """设置机器标识，lease_expires_at 为租约的过期时间（time.monotonic），过期后拒绝生成 ID"""
+        if not 0 <= worker_id <= self.max_worker_id or not 0 <= data_center_id <= self.max_data_center_id:
+            raise ValueError(f'Invalid worker id {worker_id} or data center id {data_center_id}')
+        with self.lock:
+            self.worker_id = worker_id
+            self.data_center_id = data_center_id
+            # 数据中心和机器标识符部分固定不变，预先计算
+            self.node_bits = (data_center_id << self.data_center_id_shift) | (worker_id << self.worker_id_shift)
+            self.lease_expires_at = lease_expires_at
+
+    def _check_lease(self):
+        if self.lease_expires_at is not None and time.monotonic() >= self.lease_expires_at:
+            raise Exception('Worker id lease lost. Refusing to generate id.')
+
+    def _reserve(self, count: int) -> Tuple[int, int, int]:
+        """
+        预留最多 count 个连续的序列号，返回 (ID 基数, 起始序列号, 结束序列号)，调用方需持有锁
+        时钟回拨在容忍范围内时沿用上次的时间戳继续消耗序列号，序列号用尽则借用下一毫秒
+        """
+        now = _current_timestamp()
+        timestamp = now
+        if now < self.last_timestamp:
+            if self.last_timestamp - now > self.max_clock_skew:
+                raise Exception('Clock moved backwards. Refusing to generate id.')
+            timestamp = self.last_timestamp
+
+        start = self.sequence + 1 if timestamp == self.last_timestamp else 0
+        if start > self.max_sequence:
+            start = 0
+            if now < self.last_timestamp and self.last_timestamp + 1 - now <= self.max_clock_skew:
+                timestamp = self.last_timestamp + 1
+            else:
+                # 序列号用尽，等待下一毫秒
+                timestamp = _wait_for_next_timestamp(self.last_timestamp)
+
+        end = min(self.max_sequence, start + count - 1)
+        self.sequence = end
+        self.generated += end - start + 1
+        self.last_timestamp = timestamp
+        # 组合时间戳和机器标识，并进行掩码，确保不超过总位数
+        base = (((timestamp - self.start_timestamp) << self.timestamp_shift) | self.node_bits) & self.mask
+        return base, start, end
 
     def generate_id(self):
         """生成唯一 ID"""
         with self.lock:
-            timestamp = _current_timestamp()
-
-            if timestamp == self.last_timestamp:
-                # 同一毫秒内，递增序列号
-                self.sequence = (self.sequence + 1) & self.max_sequence
-                if self.sequence == 0:
-                    # 序列号用尽，等待下一毫秒
-                    timestamp = _wait_for_next_timestamp(self.last_timestamp)
-            else:
-                self.sequence = 0  # 不同毫秒内，重置序列号
+            self._check_lease()
+            base, sequence, _ = self._reserve(1)
+            return base | sequence
 
-            if timestamp < self.last_timestamp:
-                raise Exception('Clock moved backwards. Refusing to generate id.')
+    def generate_ids(self, n: int) -> array:
+        """
+        批量生成 n 个唯一 ID
+        一次加锁预留连续的序列号区间，当前毫秒的序列号用尽时顺延到下一毫秒
+        """
+        ids = array('q')
+        with self.lock:
+            self._check_lease()
+            while len(ids) < n:
+                base, start, end = self._reserve(n - len(ids))
+                ids.extend(range(base + start, base + end + 1))
+        return ids
+
+
+class ThreadLocalGenerator:
+    """
+    每个线程独占一个生成器，避免所有线程争用同一把锁
+    从机器标识的低 slot_bits 位划分出子标识：子标识 0 为共用生成器，其余分配给线程独占，
+    子标识用尽后的线程使用共用生成器，线程结束后子标识连同其时间戳和序列号状态交还给后续线程。
+    同一事件循环中的协程运行在同一线程，共用该线程的生成器，不存在锁争用
+    """
+
+    def __init__(self, worker_id, data_center_id=0, slot_bits=0, **layout):
+        if slot_bits > layout.get('worker_id_bits', 5):
+            raise ValueError(f'Thread slot bits {slot_bits} exceed worker id bits')
+        self.slot_bits = slot_bits
+        self._check_worker_id(worker_id)
+        self.shared = UniqueIDGenerator(worker_id, data_center_id, **layout)
+        self.generators = [self.shared] + [
+            UniqueIDGenerator(worker_id + i, data_center_id, **layout) for i in range(1, 1 << slot_bits)
+        ]
+        # list 的 append/pop 在 GIL 下是原子操作，分配和归还子标识无需加锁
+        self._free = self.generators[:0:-1]
+        self._local = threading.local()
+
+    def _check_worker_id(self, worker_id):
+        if worker_id & ((1 << self.slot_bits) - 1):
+            raise ValueError(f'Worker id {worker_id} is not aligned to {1 << self.slot_bits} thread slots')
+
+    def get(self) -> UniqueIDGenerator:
+        """获取当前线程的生成器"""
+        generator_ = getattr(self._local, 'generator', None)
+        if generator_ is None:
+            try:
+                generator_ = self._free.pop()
+                # 线程结束时 threading.local 中的对象被回收，归还子标识
+                self._local.owner = _SlotOwner(self._free, generator_)
+            except IndexError:
+                generator_ = self.shared
+            self._local.generator = generator_
+        return generator_
+
+    def assign(self, worker_id, data_center_id=0, lease_expires_at: Optional[float] = None):
+        """设置起始机器标识，各子标识依次为 worker_id + i"""
+        self._check_worker_id(worker_id)
+        for i, generator_ in enumerate(self.generators):
+            generator_.assign(worker_id + i, data_center_id, lease_expires_at)
+
+    def set_lease_expires_at(self, lease_expires_at: Optional[float]):
+        for generator_ in self.generators:
+            generator_.lease_expires_at = lease_expires_at
 
-            self.last_timestamp = timestamp
+    @property
+    def generated(self) -> int:
+        return sum(generator_.generated for generator_ in self.generators)
+
+    def generate_id(self):
+        return self.get().generate_id()
+
+    def generate_ids(self, n: int) -> array:
+        return self.get().generate_ids(n)
 
-            # 组合各个部分生成最终的 ID
-            id_ = (
-                ((timestamp - self.start_timestamp) << self.timestamp_shift)
-                | (self.data_center_id << self.data_center_id_shift)
-                | (self.worker_id << self.worker_id_shift)
-                | self.sequence
-            )
 
-            # 对 ID 进行掩码，确保不超过 53 位
-            id_ &= self.mask
+class _SlotOwner:
+    __slots__ = ('free', 'generator')
 
-            return id_
+    def __init__(self, free: list, generator_: UniqueIDGenerator):
+        self.free = free
+        self.generator = generator_
 
+    def __del__(self):
+        self.free.append(self.generator)
 
-# 创建生成器实例
-generator = UniqueIDGenerator(_get_worker_id())
+
+# 创建生成器实例，启动时通过 acquire_worker_lease 分配集群内唯一的标识
+_data_center_id, _worker_id = _get_static_slot()
+generator = ThreadLocalGenerator(
+    _worker_id,
+    _data_center_id,
+    settings.SNOWFLAKE_THREAD_SLOT_BITS,
+    max_clock_skew=settings.SNOWFLAKE_MAX_CLOCK_SKEW,
+    **LAYOUT,
+)
 
 
 def get_next_id():
     return generator.generate_id()
+
+
+def get_next_ids(n: int) -> array:
+    """批量获取 n 个 ID，适用于批量插入"""
+    return generator.generate_ids(n)
+
+
+class _WorkerLease:
+    key: Optional[str] = None
+    token: Optional[str] = None
+    task: Optional[asyncio.Task] = None
+
+
+_lease = _WorkerLease()
+
+
+async def _claim_slot(rds) -> bool:
+    """
+    从进程号推导的位置开始依次尝试 SET NX 占用空闲的 (数据中心, 机器) 标识
+    配置了 SNOWFLAKE_DATA_CENTER_ID 时只在该数据中心内分配机器标识
+    """
+    ttl_ms = int(settings.SNOWFLAKE_LEASE_TTL * 1000)
+    token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}'
+    first, count = 0, SLOT_COUNT
+    if settings.SNOWFLAKE_DATA_CENTER_ID is not None:
+        first, count = settings.SNOWFLAKE_DATA_CENTER_ID * WORKER_COUNT, WORKER_COUNT
+    # 每个进程占用 SLOT_STEP 个连续的机器标识，供各线程的生成器使用
+    start = os.getpid() % (count // SLOT_STEP) * SLOT_STEP
+    for i in range(0, count, SLOT_STEP):
+        slot = first + (start + i) % count
+        key = f'{LEASE_KEY_PREFIX}{slot}'
+        requested_at = time.monotonic()
+        if await rds.set(key, token, nx=True, px=ttl_ms):
+            data_center_id, worker_id = divmod(slot, WORKER_COUNT)
+            generator.assign(worker_id, data_center_id, requested_at + settings.SNOWFLAKE_LEASE_TTL)
+            _lease.key, _lease.token = key, token
+            logger.info(f'Snowflake worker lease acquired: data_center_id={data_center_id}, worker_id={worker_id}')
+            return True
+    return False
+
+
+async def _heartbeat():
+    """定期续约，续约失败时尝试重新占用，期间租约过期则生成器拒绝生成 ID"""
+    from redis import RedisError
+    from utils.connect import get_async_redis_connection
+
+    interval = settings.SNOWFLAKE_LEASE_TTL / 3
+    ttl_ms = int(settings.SNOWFLAKE_LEASE_TTL * 1000)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            rds = await get_async_redis_connection()
+            requested_at = time.monotonic()
+            renewed = await rds.eval(_RENEW_SCRIPT, 1, _lease.key, _lease.token, ttl_ms)
+            if renewed:
+                generator.set_lease_expires_at(requested_at + settings.SNOWFLAKE_LEASE_TTL)
+                continue
+            logger.error(f'Snowflake worker lease lost: {_lease.key}, reacquiring')
+            generator.set_lease_expires_at(0)
+            await _claim_slot(rds)
+        except RedisError as e:
+            logger.warning(f'Snowflake worker lease renew failed: {e}')
+
+
+async def acquire_worker_lease():
+    """
+    启动时分配集群内唯一的机器标识
+    配置了 SNOWFLAKE_WORKER_ID 时使用固定标识，否则通过 redis 租约分配并定期续约
+    （配置了 SNOWFLAKE_DATA_CENTER_ID 时只分配该数据中心内的机器标识），
+    redis 不可用时退回到由进程号推导的标识
+    """
+    if settings.SNOWFLAKE_WORKER_ID is not None:
+        return
+    from redis import RedisError
+    from utils.connect import get_async_redis_connection
+
+    try:
+        rds = await get_async_redis_connection()
+        claimed = await _claim_slot(rds)
+    except RedisError as e:
+        logger.warning(f'Snowflake worker lease unavailable, using pid derived worker id: {e}')
+        return
+    if not claimed:
+        raise RuntimeError('No free snowflake worker slot')
+    _lease.task = asyncio.create_task(_heartbeat())
+
+
+async def release_worker_lease():
+    """关闭时停止续约并释放租约"""
+    if _lease.task:
+        _lease.task.cancel()
+        _lease.task = None
+    if not _lease.key:
+        return
+    from redis import RedisError
+    from utils.connect import get_async_redis_connection
+
+    try:
+        rds = await get_async_redis_connection()
+        await rds.eval(_RELEASE_SCRIPT, 1, _lease.key, _lease.token)
+    except RedisError as e:
+        logger.warning(f'Snowflake worker lease release failed: {e}')
+    _lease.key = _lease.token = None